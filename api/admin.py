@@ -1,5 +1,15 @@
 from django.contrib.gis import admin
-from .models import Profile, Photo, Group, Match, VerificationCode
+from .models import (
+    Profile,
+    Photo,
+    Group,
+    Match,
+    VerificationCode,
+    SwipeEvent,
+    Like,
+    Job,
+    Report,
+)
 
 # Register your models here.
 admin.site.register(Profile, admin.OSMGeoAdmin)
@@ -7,3 +17,7 @@ admin.site.register(Photo, admin.OSMGeoAdmin)
 admin.site.register(Match, admin.OSMGeoAdmin)
 admin.site.register(Group, admin.OSMGeoAdmin)
 admin.site.register(VerificationCode, admin.OSMGeoAdmin)
+admin.site.register(SwipeEvent, admin.OSMGeoAdmin)
+admin.site.register(Like, admin.OSMGeoAdmin)
+admin.site.register(Job, admin.OSMGeoAdmin)
+admin.site.register(Report, admin.OSMGeoAdmin)
@@ -5,3 +5,9 @@ class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     # name of the folder (api)
     name = "api"
+
+    def ready(self):
+        # connect the signals that keep the profile counters and the last
+        # message of the conversations
+        import api.handlers.counters  # noqa: F401
+        import api.handlers.last_message  # noqa: F401
@@ -0,0 +1,70 @@
+"""
+    Denormalized counters of the profile (likes_count and matches_count)
+
+    The counters are updated with F() expressions from the signals of the Like
+    and Match models, so every path that likes, unlikes, matches, unmatches or
+    blocks keeps them right without reading the rows.
+    likes_count only counts the likes of profiles that have not matched with the
+    profile, as the likes list does. The reconcile_counters command recomputes
+    both counters from the tables.
+    The counters are only written here, with F() updates in the database and
+    never through a Profile instance: the views save an existing profile with
+    the update_fields they change, so a profile loaded before a like or a match
+    does not write back the counters it read.
+"""
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from api import models
+
+
+def increment(profile_ids, field, amount):
+    if not profile_ids:
+        return
+    models.Profile.objects.filter(id__in=profile_ids).update(
+        **{field: Greatest(F(field) + amount, 0)}
+    )
+
+
+def count_like(like, amount):
+    # the likes of a group and the likes of a matched profile are not counted
+    if like.target_id is None:
+        return
+    if not models.Match.objects.between(like.target_id, like.profile_id).exists():
+        increment([like.target_id], "likes_count", amount)
+
+
+@receiver(post_save, sender=models.Like)
+def like_created(sender, instance, created, **kwargs):
+    if created:
+        count_like(instance, 1)
+
+
+@receiver(post_delete, sender=models.Like)
+def like_deleted(sender, instance, **kwargs):
+    count_like(instance, -1)
+
+
+def get_matched_likers(match):
+    # the profiles of the match that are liked by the other profile
+    return list(
+        models.Like.objects.between(match.profile1_id, match.profile2_id).values_list(
+            "target_id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=models.Match)
+def match_created(sender, instance, created, **kwargs):
+    if not created:
+        return
+    increment([instance.profile1_id, instance.profile2_id], "matches_count", 1)
+    increment(get_matched_likers(instance), "likes_count", -1)
+
+
+@receiver(post_delete, sender=models.Match)
+def match_deleted(sender, instance, **kwargs):
+    increment([instance.profile1_id, instance.profile2_id], "matches_count", -1)
+    increment(get_matched_likers(instance), "likes_count", 1)
@@ -0,0 +1,104 @@
+"""
+    The swipe deck of a profile is the ordered list of group and profile ids
+    returned by SwipeModelViewSet.list. Building it is expensive (distance scan,
+    swipe filters), so the ids are cached per profile and the cards are hydrated
+    from the database on every read.
+
+    The deck is invalidated by the events that change it:
+    - like, unlike and pass: the card is removed from the cached deck
+    - block: the decks of both profiles are dropped
+    - location, group and profile changes: the deck of the profile is dropped
+"""
+
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+DECK_KEY = "swipe:deck:{}"
+DECK_LOCK_KEY = "swipe:deck-lock:{}"
+# seconds a swipe waits for the deck lock and the lock lives at most
+DECK_LOCK_TIMEOUT = 5
+
+
+def get_deck_key(profile_id):
+    return DECK_KEY.format(profile_id)
+
+
+"""
+    Returns the cached deck of a profile
+    @param profile_id: the id of the profile that owns the deck
+    @return: a dict with the ordered "groups" and "profiles" ids and the radius
+    in km used to find them, or None
+"""
+
+
+def get_deck(profile_id):
+    return cache.get(get_deck_key(profile_id))
+
+
+def set_deck(profile_id, group_ids, profile_ids, radius, adaptive=False):
+    deck = {
+        "groups": [str(card_id) for card_id in group_ids],
+        "profiles": [str(card_id) for card_id in profile_ids],
+        "radius": radius,
+        "adaptive": adaptive,
+    }
+    cache.set(get_deck_key(profile_id), deck, settings.SWIPE_DECK_CACHE_TIMEOUT)
+    return deck
+
+
+"""
+    Removes cards from the cached deck without rebuilding it
+    @param profile_id: the id of the profile that owns the deck
+    @param card_ids: ids of the groups or profiles to remove
+"""
+
+
+def remove_cards(profile_id, card_ids):
+    card_ids = {str(card_id) for card_id in card_ids}
+
+    # the swipes of a profile can run at the same time, each one must read the
+    # deck written by the other or it writes back the card the other removed
+    with lock_deck(profile_id):
+        deck = get_deck(profile_id)
+        if deck is None:
+            return
+
+        set_deck(
+            profile_id,
+            [group_id for group_id in deck["groups"] if group_id not in card_ids],
+            [p_id for p_id in deck["profiles"] if p_id not in card_ids],
+            deck.get("radius", settings.SWIPE_RADIUS_KM),
+            deck.get("adaptive", False),
+        )
+
+
+"""
+    Lock the deck of a profile while it is read and written back. cache.add is
+    atomic, the lock expires after DECK_LOCK_TIMEOUT seconds if its owner dies
+    @param profile_id: the id of the profile that owns the deck
+"""
+
+
+@contextmanager
+def lock_deck(profile_id):
+    key = DECK_LOCK_KEY.format(profile_id)
+    deadline = time.monotonic() + DECK_LOCK_TIMEOUT
+
+    acquired = cache.add(key, 1, DECK_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.01)
+        acquired = cache.add(key, 1, DECK_LOCK_TIMEOUT)
+
+    try:
+        yield
+    finally:
+        # a lock taken by another swipe after the timeout is not released here
+        if acquired:
+            cache.delete(key)
+
+
+def invalidate(*profile_ids):
+    cache.delete_many([get_deck_key(profile_id) for profile_id in profile_ids])
@@ -0,0 +1,291 @@
+"""
+    Optional in-process spatial index of the profiles for the swipe (SWIPE_GEO_INDEX)
+
+    The profiles with an account and a location are bucketed in a grid of
+    SWIPE_GEO_INDEX_CELL_DEGREES cells. Each cell holds a compact numpy array of
+    (id, lon, lat, age, gender, is_in_group), so the candidates within a radius
+    are found by scanning the few cells around the point instead of running a
+    distance query on the whole profile table.
+
+    The index is kept fresh by Profile.save and Profile.delete in the process
+    that handles the request, once their transaction is committed. It is
+    rebuilt from the database in a thread every SWIPE_GEO_INDEX_REFRESH seconds
+    to pick up the changes of other workers, the changes made during the
+    rebuild are applied to the new index before it is swapped in.
+"""
+
+import math
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from api import models
+
+# same sphere radius as ST_DistanceSphere so both give the same distances
+EARTH_RADIUS_KM = 6370.986
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+GENDERS = {"M": 0, "W": 1, "X": 2}
+
+ROW_DTYPE = np.dtype(
+    [
+        ("id", "V16"),
+        ("lon", "f8"),
+        ("lat", "f8"),
+        ("age", "u2"),
+        ("gender", "u1"),
+        ("is_in_group", "?"),
+    ]
+)
+
+
+class GridCell:
+    __slots__ = ("rows", "size")
+
+    def __init__(self):
+        self.rows = np.empty(8, dtype=ROW_DTYPE)
+        self.size = 0
+
+    def append(self, row):
+        if self.size == len(self.rows):
+            self.rows = np.resize(self.rows, len(self.rows) * 2)
+        self.rows[self.size] = row
+        self.size += 1
+        return self.size - 1
+
+    # remove a row moving the last row into its place, returns the moved id
+    def remove(self, index):
+        self.size -= 1
+        if index == self.size:
+            return None
+        self.rows[index] = self.rows[self.size]
+        return self.rows[index]["id"].tobytes()
+
+
+class GeoGridIndex:
+    def __init__(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        # id -> (cell key, index in the cell)
+        self.positions = {}
+        self.lock = threading.RLock()
+        self.built_at = time.monotonic()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def get_cell_key(self, lon, lat):
+        return (
+            math.floor(lon / self.cell_degrees),
+            math.floor(lat / self.cell_degrees),
+        )
+
+    def upsert(self, profile_id, lon, lat, age, gender, is_in_group):
+        key = uuid.UUID(str(profile_id)).bytes
+        row = (key, lon, lat, age or 0, GENDERS.get(gender, 0), is_in_group)
+
+        with self.lock:
+            self.remove(profile_id)
+            cell_key = self.get_cell_key(lon, lat)
+            cell = self.cells.setdefault(cell_key, GridCell())
+            self.positions[key] = (cell_key, cell.append(row))
+
+    def remove(self, profile_id):
+        key = uuid.UUID(str(profile_id)).bytes
+
+        with self.lock:
+            position = self.positions.pop(key, None)
+            if position is None:
+                return
+
+            cell_key, index = position
+            cell = self.cells[cell_key]
+            moved_key = cell.remove(index)
+            if moved_key is not None:
+                self.positions[moved_key] = (cell_key, index)
+            if cell.size == 0:
+                del self.cells[cell_key]
+
+    """
+        Profiles within a radius matching the swipe preferences
+        @param lon, lat: the center of the search
+        @param radius_km: the search radius
+        @param gender: M, W or None for everyone
+        @param min_age, max_age: inclusive age range or None
+        @param is_in_group: True, False or None for both
+        @return: list of profile UUIDs
+    """
+
+    def query(
+        self,
+        lon,
+        lat,
+        radius_km,
+        gender=None,
+        min_age=None,
+        max_age=None,
+        is_in_group=None,
+    ):
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_span, 90))), 1e-6)
+        lon_span = min(lat_span / cos_lat, 180)
+
+        min_cell = self.get_cell_key(lon - lon_span, lat - lat_span)
+        max_cell = self.get_cell_key(lon + lon_span, lat + lat_span)
+
+        with self.lock:
+            chunks = [
+                self.cells[(cx, cy)].rows[: self.cells[(cx, cy)].size]
+                for cx in range(min_cell[0], max_cell[0] + 1)
+                for cy in range(min_cell[1], max_cell[1] + 1)
+                if (cx, cy) in self.cells
+            ]
+            if not chunks:
+                return []
+            rows = np.concatenate(chunks)
+
+        mask = np.ones(len(rows), dtype=bool)
+        if gender is not None:
+            mask &= rows["gender"] == GENDERS[gender]
+        if min_age is not None:
+            mask &= rows["age"] >= min_age
+        if max_age is not None:
+            mask &= rows["age"] <= max_age
+        if is_in_group is not None:
+            mask &= rows["is_in_group"] == is_in_group
+        rows = rows[mask]
+
+        mask = haversine_km(lon, lat, rows["lon"], rows["lat"]) < radius_km
+        return [uuid.UUID(bytes=key.tobytes()) for key in rows["id"][mask]]
+
+
+def haversine_km(lon, lat, lons, lats):
+    lon, lat, lons, lats = map(np.radians, (lon, lat, lons, lats))
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = False
+# profile id -> (lon, lat, age, gender, is_in_group), or None when it is removed,
+# of the profiles changed while the index is rebuilt
+_changes = {}
+
+
+def is_enabled():
+    return settings.SWIPE_GEO_INDEX
+
+
+"""
+    Returns the index of the process. The first call builds it from the
+    database, later calls return it at once: when it is older than
+    SWIPE_GEO_INDEX_REFRESH seconds a thread rebuilds it and swaps it in, the
+    requests keep using the current index meanwhile
+"""
+
+
+def get_index():
+    global _index, _rebuilding
+
+    index = _index
+    if index is None:
+        # only one request builds the first index, the others wait for it
+        with _index_lock:
+            if _index is None:
+                _index = build_index()
+            return _index
+
+    if time.monotonic() - index.built_at > settings.SWIPE_GEO_INDEX_REFRESH:
+        with _index_lock:
+            start = not _rebuilding
+            if start:
+                _rebuilding = True
+                _changes.clear()
+        if start:
+            threading.Thread(target=rebuild_index, daemon=True).start()
+
+    return index
+
+
+def rebuild_index():
+    global _index, _rebuilding
+
+    try:
+        # built outside the lock, the new index replaces the old one at once
+        index = build_index()
+        with _index_lock:
+            # the profiles changed during the build may be missing from it
+            for profile_id, row in _changes.items():
+                apply_change(index, profile_id, row)
+            _index = index
+    finally:
+        with _index_lock:
+            _rebuilding = False
+            _changes.clear()
+        connection.close()
+
+
+def build_index():
+    index = GeoGridIndex(settings.SWIPE_GEO_INDEX_CELL_DEGREES)
+    profiles = models.Profile.objects.filter(
+        has_account=True, location__isnull=False
+    ).values_list("id", "location", "age", "gender", "is_in_group")
+
+    for profile_id, location, age, gender, is_in_group in profiles.iterator(
+        chunk_size=5000
+    ):
+        index.upsert(profile_id, location.x, location.y, age, gender, is_in_group)
+
+    return index
+
+
+"""
+    Update the profile in the index, Profile.save calls it once the transaction
+    is committed
+    @param profile: the saved profile
+"""
+
+
+def update_profile(profile):
+    if profile.has_account and profile.location is not None:
+        row = (
+            profile.location.x,
+            profile.location.y,
+            profile.age,
+            profile.gender,
+            profile.is_in_group,
+        )
+    else:
+        row = None
+    change_profile(profile.id, row)
+
+
+def remove_profile(profile_id):
+    change_profile(profile_id, None)
+
+
+def change_profile(profile_id, row):
+    # only update an index already built, otherwise it is built on the next read
+    if not is_enabled() or _index is None:
+        return
+
+    with _index_lock:
+        index = _index
+        # replayed on the index being rebuilt before it is swapped in
+        if _rebuilding:
+            _changes[profile_id] = row
+    apply_change(index, profile_id, row)
+
+
+def apply_change(index, profile_id, row):
+    if row is None:
+        index.remove(profile_id)
+    else:
+        index.upsert(profile_id, *row)
@@ -0,0 +1,147 @@
+"""
+    Lightweight background jobs (JOBS_BACKEND)
+
+    A job is a function decorated with @job that receives JSON serializable
+    keyword arguments. enqueue() stores it in the Job table in the same
+    transaction as the request, and the run_jobs worker runs it with retries and
+    exponential backoff. With the "memory" backend the job runs in the same
+    process once the transaction is committed and its retries run in a thread
+    after the same backoff, so no worker is needed locally and in tests.
+"""
+
+import logging
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from api import models
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Mark a function as a job, only these functions can be run by the worker
+"""
+
+
+def job(function):
+    function.is_job = True
+    return function
+
+
+def get_job_name(function):
+    return f"{function.__module__}.{function.__name__}"
+
+
+def get_job_function(name):
+    function = import_string(name)
+    if not getattr(function, "is_job", False):
+        raise ValueError(f"{name} is not a job")
+    return function
+
+
+"""
+    Run a job in the background
+    @param function: a function decorated with @job
+    @param kwargs: JSON serializable arguments of the function
+    @return: the Job object, or None with the memory backend
+"""
+
+
+def enqueue(function, **kwargs):
+    name = get_job_name(function)
+
+    if settings.JOBS_BACKEND == "memory":
+        transaction.on_commit(lambda: run_in_memory(name, kwargs))
+        return None
+
+    return models.Job.objects.create(
+        name=name, payload=kwargs, max_attempts=settings.JOBS_MAX_ATTEMPTS
+    )
+
+
+def run_in_memory(name, payload, attempt=1):
+    try:
+        get_job_function(name)(**payload)
+    except Exception:
+        logger.exception("Job %s failed (attempt %s)", name, attempt)
+        if attempt >= settings.JOBS_MAX_ATTEMPTS:
+            return
+
+        # retried in a thread with the same backoff as the worker
+        backoff = settings.JOBS_RETRY_BACKOFF * 2 ** (attempt - 1)
+        retry = threading.Timer(
+            backoff, retry_in_memory, args=(name, payload, attempt + 1)
+        )
+        retry.daemon = True
+        retry.start()
+
+
+def retry_in_memory(name, payload, attempt):
+    try:
+        run_in_memory(name, payload, attempt)
+    finally:
+        # the thread has its own database connection
+        connection.close()
+
+
+"""
+    Claim the jobs ready to run, the rows locked by other workers are skipped
+    so many workers can claim jobs at the same time
+    @param limit: max number of jobs to claim
+    @return: list of the claimed jobs, already marked as running
+"""
+
+
+def claim_jobs(limit):
+    now = timezone.now()
+    lost = now - timezone.timedelta(seconds=settings.JOBS_TIMEOUT)
+
+    with transaction.atomic():
+        jobs = list(
+            models.Job.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=models.Job.STATUS.PENDING, run_at__lte=now)
+                | Q(status=models.Job.STATUS.RUNNING, locked_at__lt=lost)
+            )
+            .order_by("run_at")[:limit]
+        )
+        models.Job.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=models.Job.STATUS.RUNNING, locked_at=now
+        )
+
+    return jobs
+
+
+"""
+    Run a claimed job, on failure it is scheduled again with exponential backoff
+    until max_attempts is reached
+    @param job: the Job object
+    @return: True if the job succeeded
+"""
+
+
+def run_job(job):
+    job.attempts += 1
+
+    try:
+        get_job_function(job.name)(**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = models.Job.STATUS.FAILED
+        else:
+            backoff = settings.JOBS_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.status = models.Job.STATUS.PENDING
+            job.run_at = timezone.now() + timezone.timedelta(seconds=backoff)
+        job.save(update_fields=["attempts", "status", "run_at", "last_error"])
+        logger.exception("Job %s failed (attempt %s)", job.name, job.attempts)
+        return False
+
+    job.status = models.Job.STATUS.DONE
+    job.save(update_fields=["attempts", "status"])
+    return True
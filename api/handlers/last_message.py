@@ -0,0 +1,52 @@
+"""
+    Last message of the conversations when a message is deleted
+
+    Message.save keeps the newest message of the conversation in last_message
+    and last_message_at for the inbox. When that message is deleted, the
+    conversation takes the newest message left, both fields in one update.
+    The messages deleted with their conversation are skipped.
+"""
+
+import threading
+
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+from api import models
+
+# ids of the conversations the current thread is deleting
+deleting = threading.local()
+
+
+def get_deleting_ids():
+    if not hasattr(deleting, "ids"):
+        deleting.ids = set()
+    return deleting.ids
+
+
+# the delete sends pre_delete for the conversation before deleting its messages
+@receiver(pre_delete, sender=models.Conversation)
+def conversation_deleting(sender, instance, **kwargs):
+    get_deleting_ids().add(instance.pk)
+
+
+@receiver(post_delete, sender=models.Conversation)
+def conversation_deleted(sender, instance, **kwargs):
+    get_deleting_ids().discard(instance.pk)
+
+
+@receiver(post_delete, sender=models.Message)
+def message_deleted(sender, instance, **kwargs):
+    if instance.conversation_id in get_deleting_ids():
+        return
+
+    newest = models.Message.objects.filter(conversation=OuterRef("pk")).order_by(
+        "-sent_at", "-id"
+    )
+    # only when the deleted message was the newest one
+    models.Conversation.objects.filter(
+        pk=instance.conversation_id, last_message_at__lte=instance.sent_at
+    ).update(
+        last_message=Subquery(newest.values("id")[:1]),
+        last_message_at=Subquery(newest.values("sent_at")[:1]),
+    )
@@ -0,0 +1,44 @@
+"""
+    Likes inbox of a profile computed in one query
+
+    The likes received by the current profile (and by its group) from profiles
+    that have not matched with it are grouped by card: the group of the liker,
+    or the liker itself if it is not in a group. Each card is dated by its
+    newest like.
+"""
+
+from django.db.models import Exists, F, Max, OuterRef, Q
+from django.db.models.functions import Coalesce
+from api import models
+
+
+def get_likes_inbox(current_profile):
+    current_group = (
+        current_profile.member_group.all()[0] if current_profile.is_in_group else None
+    )
+
+    # the likes of the current profile and the likes of its group
+    received = Q(target=current_profile)
+    if current_group:
+        received |= Q(group=current_group)
+
+    matches = models.Match.objects.filter(
+        Q(profile1=current_profile, profile2=OuterRef("profile"))
+        | Q(profile1=OuterRef("profile"), profile2=current_profile)
+    )
+    # the group of the liker has matched with the current profile
+    group_matches = models.Group.matches.through.objects.filter(
+        group__members=OuterRef("profile")
+    ).filter(Q(match__profile1=current_profile) | Q(match__profile2=current_profile))
+
+    likes = models.Like.objects.filter(received).filter(
+        ~Exists(matches), ~Exists(group_matches)
+    )
+    if current_group:
+        likes = likes.exclude(profile__member_group=current_group)
+
+    # one row per card, a profile is in one group at most
+    return likes.values(
+        liker_group=F("profile__member_group"),
+        card=Coalesce("profile__member_group", "profile"),
+    ).annotate(liked_at=Max("created_at"))
@@ -1,15 +1,19 @@
 from rest_framework import status
 from rest_framework.response import Response
+from django.db import transaction
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.gis.measure import D
-from django.db.models import Q
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from api import models, serializers
 
+import api.handlers.notifications as notifications
+
 # response constants to identify the type of match in the frontend
 ALREADY_MATCHED = "ALREADY_MATCHED"
 NEW_MATCH = "NEW_MATCH"
 SAME_MATCH = "SAME_MATCH"
 LIKE = "LIKE"
+PASS = "PASS"
 
 # constants to identify who is the group in the match
 NEITHER = "NEITHER"
@@ -43,18 +47,7 @@ def get_matched_profile(current_profile, match):
 
 
 def check_two_profiles_have_match(profile1_id, profile2_id):
-    current_matches = models.Match.objects.filter(
-        Q(profile1=profile1_id) | Q(profile2=profile1_id)
-    )
-
-    liked_matches = models.Match.objects.filter(
-        Q(profile1=profile2_id) | Q(profile2=profile2_id)
-    )
-
-    if current_matches.filter(id__in=liked_matches).exists():
-        return True
-
-    return False
+    return models.Match.objects.between(profile1_id, profile2_id).exists()
 
 
 """
@@ -68,17 +61,10 @@ def check_two_profiles_have_match(profile1_id, profile2_id):
 
 
 def check_profile_group_has_match(profile_id, group):
-    current_profile_matches = models.Match.objects.filter(
-        Q(profile1=profile_id) | Q(profile2=profile_id)
-    )
-
     # it is a many to many
-    group_matches = group.matches.all()
-
-    if current_profile_matches.filter(id__in=group_matches).exists():
-        return True
-
-    return False
+    return group.matches.filter(
+        Q(profile1=profile_id) | Q(profile2=profile_id)
+    ).exists()
 
 
 """
@@ -110,14 +96,31 @@ def check_two_group_has_match(group1, group2):
 
 
 def get_match(p1, p2):
-    match = models.Match.objects.filter(
-        Q(profile1=p1, profile2=p2) | Q(profile1=p2, profile2=p1)
-    )
+    return models.Match.objects.between(p1, p2).first()
+
+
+"""
+    Given the members of a group that have liked the current profile, choose in one
+    query the member to match with: a member without a match with the current
+    profile if there is any, otherwise a member whose match can be recycled
+
+    @param current_profile: the profile object of the current user
+    @param members: queryset of the members that have liked the current profile
+    @return: the member annotated with match_id (None if they have not matched yet),
+    or None if no member has liked the current profile
+"""
 
-    if match.exists():
-        return match.first()
 
-    return None
+def get_member_to_match(current_profile, members):
+    matches = models.Match.objects.filter(
+        Q(profile1=current_profile, profile2=OuterRef("pk"))
+        | Q(profile1=OuterRef("pk"), profile2=current_profile)
+    )
+    return (
+        members.annotate(match_id=Subquery(matches.values("id")[:1]))
+        .order_by(F("match_id").asc(nulls_first=True))
+        .first()
+    )
 
 
 """
@@ -132,10 +135,12 @@ def get_match(p1, p2):
 
 def like_one_to_one(request, current_profile, liked_profile):
     # like the profile
-    liked_profile.likes.add(current_profile)
+    models.Like.objects.add(current_profile, target=liked_profile)
 
-    # check if the current profile is already a like of the liked_profile (mutual like)
-    if current_profile.likes.filter(id=liked_profile.id).exists():
+    # check if the liked profile has already liked the current profile (mutual like)
+    if models.Like.objects.filter(
+        profile=liked_profile, target=current_profile
+    ).exists():
 
         already_matched = check_two_profiles_have_match(
             current_profile.id, liked_profile.id
@@ -144,10 +149,12 @@ def like_one_to_one(request, current_profile, liked_profile):
         if already_matched:
             return Response({"details": ALREADY_MATCHED}, status=status.HTTP_200_OK)
 
-        match = models.Match.objects.create(
-            profile1=current_profile, profile2=liked_profile
+        match, created = models.Match.objects.get_or_create_between(
+            current_profile, liked_profile
         )
-        match.save()
+        if not created:
+            return Response({"details": ALREADY_MATCHED}, status=status.HTTP_200_OK)
+
         match_serializer = serializers.MatchSerializer(
             match, many=False, context={"request": request}
         )
@@ -182,65 +189,56 @@ def like_one_to_one(request, current_profile, liked_profile):
 def like_one_to_group(request, current_profile, liked_group):
 
     # add the like (current profile) to the general likes of the group
-    liked_group.likes.add(current_profile)
+    models.Like.objects.add(current_profile, group=liked_group)
 
     # check if the current profile has already matched with the group
     already_matched = check_profile_group_has_match(current_profile.id, liked_group)
     if already_matched:
         return Response({"details": ALREADY_MATCHED}, status=status.HTTP_200_OK)
 
-    # check and get all the members who has given a like to the current profile
-    members = []
-    for member in liked_group.members.all():
-        if current_profile.likes.filter(id=member.id).exists():
-            members.append(member)
-
-    # if any member has give a like to the current profile...
-    if len(members) > 0:
-        # make a match with a member that does not have a previous match
-        for member in members:
-            already_matched = check_two_profiles_have_match(
-                current_profile.id, member.id
-            )
-            if not already_matched:
-                # create a match
-                match = models.Match.objects.create(
-                    profile1=current_profile, profile2=member
-                )
-                match.save()
-                liked_group.matches.add(match)
-                liked_group.save()
-
-                match_serializer = serializers.MatchSerializer(
-                    match, many=False, context={"request": request}
-                )
-
-                return Response(
-                    {
-                        "details": NEW_MATCH,
-                        "group_match": LIKED,
-                        "match_data": match_serializer.data,
-                    },
-                    status=status.HTTP_200_OK,
-                )
-
-        # if there is no member with which it does not have a match, recycle the previous match
-        for member in members:
-            if get_match(current_profile.id, member.id):
-                match = get_match(current_profile.id, member.id)
-                match_serializer = serializers.MatchSerializer(
-                    match, many=False, context={"request": request}
-                )
-                return Response(
-                    {
-                        "details": SAME_MATCH,
-                        "group_match": LIKED,
-                        "match_data": match_serializer.data,
-                    },
-                    status=status.HTTP_200_OK,
-                )
+    # the members who have given a like to the current profile
+    liked_current_profile = models.Like.objects.filter(
+        profile=OuterRef("pk"), target=current_profile
+    )
+    members = liked_group.members.filter(Exists(liked_current_profile))
 
-    return Response({"details": LIKE}, status=status.HTTP_200_OK)
+    member = get_member_to_match(current_profile, members)
+
+    if member is None:
+        return Response({"details": LIKE}, status=status.HTTP_200_OK)
+
+    # make a match with a member that does not have a previous match
+    if member.match_id is None:
+        match, created = models.Match.objects.get_or_create_between(
+            current_profile, member
+        )
+        liked_group.matches.add(match)
+
+        match_serializer = serializers.MatchSerializer(
+            match, many=False, context={"request": request}
+        )
+        return Response(
+            {
+                "details": NEW_MATCH,
+                "group_match": LIKED,
+                "match_data": match_serializer.data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    # if there is no member with which it does not have a match, recycle the previous match
+    match = models.Match.objects.get(id=member.match_id)
+    match_serializer = serializers.MatchSerializer(
+        match, many=False, context={"request": request}
+    )
+    return Response(
+        {
+            "details": SAME_MATCH,
+            "group_match": LIKED,
+            "match_data": match_serializer.data,
+        },
+        status=status.HTTP_200_OK,
+    )
 
 
 """
@@ -264,7 +262,7 @@ def like_one_to_group(request, current_profile, liked_group):
 
 def like_group_to_one(request, current_profile, current_group, liked_profile):
     # add the like
-    liked_profile.likes.add(current_profile)
+    models.Like.objects.add(current_profile, target=liked_profile)
 
     # check if the liked profile has already a match with the group
     already_matched = check_profile_group_has_match(liked_profile.id, current_group)
@@ -272,10 +270,14 @@ def like_group_to_one(request, current_profile, current_group, liked_profile):
         return Response({"details": ALREADY_MATCHED}, status=status.HTTP_200_OK)
 
     # the user may have liked the current user's group
-    like_in_group = current_group.likes.filter(id=liked_profile.id).exists()
+    like_in_group = models.Like.objects.filter(
+        profile=liked_profile, group=current_group
+    ).exists()
 
     # the user could have liked the current user before the current user belonged to a group
-    like_in_profile = current_profile.likes.filter(id=liked_profile.id).exists()
+    like_in_profile = models.Like.objects.filter(
+        profile=liked_profile, target=current_profile
+    ).exists()
 
     if like_in_group or like_in_profile:
         # check if the current user has already a match with the liked profile
@@ -296,13 +298,10 @@ def like_group_to_one(request, current_profile, current_group, liked_profile):
             )
 
         # if the current profile did not has any previous match, then create a new match
-        match = models.Match.objects.create(
-            profile1=current_profile, profile2=liked_profile
+        match, created = models.Match.objects.get_or_create_between(
+            current_profile, liked_profile
         )
-        match.save()
-
         current_group.matches.add(match)
-        current_group.save()
 
         match_serializer = serializers.MatchSerializer(
             match, many=False, context={"request": request}
@@ -334,63 +333,173 @@ def like_group_to_one(request, current_profile, current_group, liked_profile):
 
 def like_group_to_group(request, current_profile, current_group, liked_group):
 
-    # add the like the group many to many
-    liked_group.likes.add(current_profile)
+    # add the like to the group
+    models.Like.objects.add(current_profile, group=liked_group)
 
     # check if the groups have any matches in common
     group_already_matched = check_two_group_has_match(current_group, liked_group)
     if group_already_matched:
         return Response({"details": ALREADY_MATCHED}, status=status.HTTP_200_OK)
 
-    # get all the members who have already liked my group
-    members = []
-    for member in liked_group.members.all():
-        if current_group.likes.filter(id=member.id).exists():
-            members.append(member)
+    # the members who have already liked my group or the current profile
+    liked_current_profile = models.Like.objects.filter(
+        profile=OuterRef("pk"), target=current_profile
+    )
+    liked_current_group = models.Like.objects.filter(
+        profile=OuterRef("pk"), group=current_group
+    )
+    members = liked_group.members.filter(
+        Exists(liked_current_profile) | Exists(liked_current_group)
+    )
+
+    member = get_member_to_match(current_profile, members)
 
-        if current_profile.likes.filter(id=member.id).exists():
-            members.append(member)
+    if member is None:
+        return Response({"details": LIKE}, status=status.HTTP_200_OK)
 
-    if len(members) > 0:
-        for member in members:
-            already_matched = check_two_profiles_have_match(
-                current_profile.id, member.id
+    # make a match with a member that does not have a previous match
+    if member.match_id is None:
+        match, created = models.Match.objects.get_or_create_between(
+            current_profile, member
+        )
+        liked_group.matches.add(match)
+
+        match_serializer = serializers.MatchSerializer(
+            match, many=False, context={"request": request}
+        )
+        return Response(
+            {
+                "details": NEW_MATCH,
+                "group_match": BOTH,
+                "match_data": match_serializer.data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    # if there is no member with which it does not have a match, recycle the previous match
+    match = models.Match.objects.get(id=member.match_id)
+    match_serializer = serializers.MatchSerializer(
+        match, many=False, context={"request": request}
+    )
+    return Response(
+        {
+            "details": SAME_MATCH,
+            "group_match": BOTH,
+            "match_data": match_serializer.data,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+"""
+    Like a profile choosing the matchmaking of the case, the liked profile can be
+    a single profile or the member of a group and the same for the current profile
+
+    @param request: The request object.
+    @param current_profile: The profile that is making the like.
+    @param liked_profile: The profile that receives the like.
+    @return: A Response object with details on the status of the like.
+"""
+
+
+def like(request, current_profile, liked_profile):
+    current_is_in_group = current_profile.is_in_group
+    liked_is_in_group = liked_profile.is_in_group
+
+    current_group = (
+        current_profile.member_group.all()[0] if current_is_in_group else None
+    )
+    liked_group = liked_profile.member_group.all()[0] if liked_is_in_group else None
+
+    # the match can be made with the liked profile or any member of the liked group
+    if liked_group:
+        locked_ids = list(liked_group.members.values_list("id", flat=True))
+    else:
+        locked_ids = [liked_profile.id]
+
+    with transaction.atomic():
+        lock_profiles(current_profile.id, *locked_ids)
+
+        models.SwipeEvent.objects.create(
+            profile=current_profile,
+            target=liked_profile,
+            kind=models.SwipeEvent.KINDS.LIKE,
+        )
+
+        # check for one to one
+        if not current_group and not liked_group:
+            response = like_one_to_one(request, current_profile, liked_profile)
+
+        # like one to group
+        elif not current_group:
+            response = like_one_to_group(request, current_profile, liked_group)
+
+        # like group to one
+        elif not liked_group:
+            response = like_group_to_one(
+                request, current_profile, current_group, liked_profile
             )
-            # make a match with a member that does not have a previous match
-            if not already_matched:
-                match = models.Match.objects.create(
-                    profile1=current_profile, profile2=member
-                )
-                match.save()
-                liked_group.matches.add(match)
-                liked_group.save()
-
-                match_serializer = serializers.MatchSerializer(
-                    match, many=False, context={"request": request}
-                )
-                return Response(
-                    {
-                        "details": NEW_MATCH,
-                        "group_match": BOTH,
-                        "match_data": match_serializer.data,
-                    },
-                    status=status.HTTP_200_OK,
-                )
-
-        # if there is no member with which it does not have a match, recycle the previous match
-        for member in members:
-            if get_match(current_profile.id, member.id):
-                match = get_match(current_profile.id, member.id)
-                match_serializer = serializers.MatchSerializer(
-                    match, many=False, context={"request": request}
-                )
-                return Response(
-                    {
-                        "details": SAME_MATCH,
-                        "group_match": BOTH,
-                        "match_data": match_serializer.data,
-                    },
-                    status=status.HTTP_200_OK,
-                )
 
-    return Response({"details": LIKE}, status=status.HTTP_200_OK)
+        # like group to group
+        else:
+            response = like_group_to_group(
+                request, current_profile, current_group, liked_group
+            )
+
+        # notify the liked profile, or all the members of the liked group
+        if response.data["details"] == LIKE:
+            notifications.publish(
+                locked_ids, notifications.LIKE, {"profile_id": str(current_profile.id)}
+            )
+
+        # notify the matched profile with the data of the current profile
+        if response.data["details"] == NEW_MATCH:
+            match_data = response.data["match_data"]
+            notifications.publish(
+                [match_data["matched_data"]["matched_profile"]["id"]],
+                notifications.NEW_MATCH,
+                {
+                    "match_id": match_data["id"],
+                    "profile": match_data["current_profile"],
+                },
+            )
+
+        return response
+
+
+"""
+    Lock the rows of the profiles until the end of the transaction, so two likes
+    that can end up in the same match are made one after the other and the second
+    one sees the like of the first one. The rows are locked in the order of the
+    ids to avoid deadlocks.
+
+    @param profile_ids: the IDs of the profiles to lock
+"""
+
+
+def lock_profiles(*profile_ids):
+    list(
+        models.Profile.objects.select_for_update()
+        .filter(id__in=profile_ids)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+
+"""
+    Pass a profile (left swipe), it is hidden from the swipe of the current
+    profile until SWIPE_PASS_TTL has passed
+
+    @param current_profile: The profile that is making the pass.
+    @param passed_profile: The profile that receives the pass.
+    @return: A Response object with the details of the pass.
+"""
+
+
+def pass_profile(current_profile, passed_profile):
+    models.SwipeEvent.objects.create(
+        profile=current_profile,
+        target=passed_profile,
+        kind=models.SwipeEvent.KINDS.PASS,
+    )
+    return Response({"details": PASS}, status=status.HTTP_200_OK)
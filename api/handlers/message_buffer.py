@@ -0,0 +1,161 @@
+"""
+    Write-behind of the chat messages (CHAT_WRITE_BEHIND)
+
+    The consumer builds the message with its id, broadcasts it and adds it to
+    the buffer of the process. The buffer is saved with one bulk_create per
+    model when it has CHAT_WRITE_BEHIND_BATCH_SIZE messages or after
+    CHAT_WRITE_BEHIND_INTERVAL seconds. A batch that cannot be inserted is saved
+    message by message and the messages that still fail go back to the buffer,
+    up to CHAT_WRITE_BEHIND_MAX_ATTEMPTS times. The messages left in the buffer
+    or in a batch being saved are saved when the process exits.
+"""
+
+import asyncio
+import atexit
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from api import models
+
+logger = logging.getLogger(__name__)
+
+pending = []
+# batches taken from the buffer by flush and not saved yet
+in_flight = {}
+# the flush tasks are referenced until they are done, the loop only keeps weak
+# references to its tasks
+flush_tasks = set()
+flush_task = None
+
+
+"""
+    Save a batch of messages
+    @param messages: unsaved Message and MyGroupMessage
+    @return: the messages that could not be saved
+"""
+
+
+def save_messages(messages):
+    try:
+        with transaction.atomic():
+            for model in (models.Message, models.MyGroupMessage):
+                batch = [message for message in messages if isinstance(message, model)]
+                if batch:
+                    model.objects.bulk_create(batch)
+
+            # bulk_create does not call save, set the last message of the
+            # conversations
+            last_messages = {}
+            for message in messages:
+                if not isinstance(message, models.Message):
+                    continue
+                last = last_messages.get(message.conversation_id)
+                if last is None or message.sent_at >= last.sent_at:
+                    last_messages[message.conversation_id] = message
+            for message in last_messages.values():
+                message.set_last_message()
+    except Exception:
+        logger.exception("Batch of %s chat messages failed", len(messages))
+        return save_one_by_one(messages)
+    return []
+
+
+def save_one_by_one(messages):
+    # the rest of the batch is saved when a message fails (e.g. a database
+    # error or its conversation was deleted)
+    failed = []
+    for message in messages:
+        # the rolled back bulk_create marked the message as saved
+        message._state.adding = True
+        try:
+            message.save(force_insert=True)
+        except Exception:
+            logger.exception("Chat message %s could not be saved", message.id)
+            failed.append(message)
+    return failed
+
+
+"""
+    Add a message to the buffer, it must be called from the event loop of the
+    consumers. The message is saved later by a task of the loop
+    @param message: unsaved Message or MyGroupMessage
+"""
+
+
+def add(message):
+    pending.append(message)
+    if len(pending) >= settings.CHAT_WRITE_BEHIND_BATCH_SIZE:
+        task = asyncio.ensure_future(flush())
+        flush_tasks.add(task)
+        task.add_done_callback(flush_tasks.discard)
+    else:
+        schedule_flush()
+
+
+def schedule_flush():
+    global flush_task
+
+    if flush_task is None:
+        flush_task = asyncio.ensure_future(flush_later())
+
+
+async def flush_later():
+    await asyncio.sleep(settings.CHAT_WRITE_BEHIND_INTERVAL)
+    await flush()
+
+
+async def flush():
+    global flush_task
+
+    # the timer is not needed once the buffer is taken
+    if flush_task is not None and flush_task is not asyncio.current_task():
+        flush_task.cancel()
+    flush_task = None
+
+    if not pending:
+        return
+    messages = pending[:]
+    pending.clear()
+
+    in_flight[id(messages)] = messages
+    try:
+        failed = await sync_to_async(save_messages)(messages)
+    finally:
+        del in_flight[id(messages)]
+
+    retry(failed)
+
+
+def retry(messages):
+    # the failed messages go back to the buffer for the next flush, until
+    # CHAT_WRITE_BEHIND_MAX_ATTEMPTS
+    for message in messages:
+        message.write_attempts = getattr(message, "write_attempts", 0) + 1
+        if message.write_attempts >= settings.CHAT_WRITE_BEHIND_MAX_ATTEMPTS:
+            logger.error(
+                "Chat message %s dropped after %s attempts",
+                message.id,
+                settings.CHAT_WRITE_BEHIND_MAX_ATTEMPTS,
+            )
+        else:
+            pending.append(message)
+
+    if pending:
+        schedule_flush()
+
+
+@atexit.register
+def flush_on_exit():
+    # the buffer and the batches whose save was interrupted, a batch already
+    # committed fails as duplicate and is not saved twice
+    messages = [message for batch in in_flight.values() for message in batch]
+    messages += pending
+    in_flight.clear()
+    pending.clear()
+    if not messages:
+        return
+
+    for message in save_messages(messages):
+        logger.error("Chat message %s lost on exit", message.id)
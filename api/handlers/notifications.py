@@ -0,0 +1,58 @@
+"""
+    Real-time notifications of a profile over the channel layer
+
+    Every profile connected to the notifications websocket joins its own group
+    notifications_<profile id>. The matchmaking publishes the events to that
+    group once the transaction is committed, so the clients receive the likes
+    and the matches without polling the likes and matches endpoints.
+"""
+
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_GROUP = "notifications_{}"
+
+# events sent to the clients
+LIKE = "LIKE"
+NEW_MATCH = "NEW_MATCH"
+UNMATCH = "UNMATCH"
+
+
+def get_group_name(profile_id):
+    return NOTIFICATIONS_GROUP.format(profile_id)
+
+
+"""
+    Publish an event to the profiles after the current transaction is committed,
+    a rolled back like does not notify anyone
+    @param profile_ids: the ids of the profiles to notify
+    @param event: LIKE, NEW_MATCH or UNMATCH
+    @param data: a JSON serializable dict with the data of the event
+"""
+
+
+def publish(profile_ids, event, data):
+    profile_ids = [str(profile_id) for profile_id in profile_ids]
+    transaction.on_commit(lambda: send(profile_ids, event, data))
+
+
+def send(profile_ids, event, data):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    for profile_id in profile_ids:
+        # the notification is best effort, the clients still can read the
+        # likes and matches endpoints
+        try:
+            async_to_sync(channel_layer.group_send)(
+                get_group_name(profile_id),
+                {"type": "notify", "event": event, "data": data},
+            )
+        except Exception:
+            logger.exception("Could not send the %s notification", event)
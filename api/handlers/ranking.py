@@ -0,0 +1,135 @@
+"""
+    Ranking of the swipe cards (SWIPE_RANKING)
+
+    After the swipe filters the candidates are scored in one batch with numpy
+    arrays, the score combines the distance, the age closeness, the recency of
+    the activity, the number of photos and whether the candidate already liked
+    the current profile. The weights are in SWIPE_RANKING_WEIGHTS.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Exists, OuterRef
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from api import models
+
+import api.handlers.geo_index as geo_index
+
+# each feature is normalized to [0, 1] using these scales
+AGE_SCALE = 10
+RECENCY_DAYS = 7
+MAX_PHOTOS = 5
+
+
+"""
+    Compute the score of every candidate
+    @param features: dict of numpy arrays with the same length: distance (km),
+    age_gap (years), inactive_days, photos and liked_me
+    @param radius: the search radius in km
+    @param weights: dict with the weight of each feature
+    @return: numpy array of scores, higher is better
+"""
+
+
+def score(features, radius, weights):
+    distance = 1 - np.minimum(features["distance"] / radius, 1)
+    age = 1 - np.minimum(features["age_gap"] / AGE_SCALE, 1)
+    recency = np.exp(-features["inactive_days"] / RECENCY_DAYS)
+    photos = np.minimum(features["photos"], MAX_PHOTOS) / MAX_PHOTOS
+
+    return (
+        weights["distance"] * distance
+        + weights["age"] * age
+        + weights["recency"] * recency
+        + weights["photos"] * photos
+        + weights["liked_me"] * features["liked_me"]
+    )
+
+
+def rank(ids, features, radius):
+    if not ids:
+        return []
+    scores = score(features, radius, settings.SWIPE_RANKING_WEIGHTS)
+    # stable sort so candidates with the same score keep the database order
+    order = np.argsort(-scores, kind="stable")
+    return [ids[i] for i in order]
+
+
+def get_features(current_profile, rows):
+    now = timezone.now()
+    location = current_profile.location
+
+    lons = np.array([row[1].x if row[1] else location.x for row in rows], dtype=float)
+    lats = np.array([row[1].y if row[1] else location.y for row in rows], dtype=float)
+
+    return {
+        "distance": geo_index.haversine_km(location.x, location.y, lons, lats),
+        "age_gap": np.abs(
+            np.array([row[2] or 0 for row in rows], dtype=float)
+            - (current_profile.age or 0)
+        ),
+        "inactive_days": np.array(
+            [(now - row[3]).total_seconds() / 86400 for row in rows], dtype=float
+        ),
+        "photos": np.array([row[4] for row in rows], dtype=float),
+        "liked_me": np.array([row[5] for row in rows], dtype=float),
+    }
+
+
+"""
+    Order the profiles of the swipe by score
+    @param current_profile: the profile that swipes
+    @param profiles: queryset of profiles already filtered
+    @param radius: the search radius in km
+    @return: list of the profile ids ordered by score
+"""
+
+
+def rank_profiles(current_profile, profiles, radius):
+    liked_me = models.Like.objects.filter(
+        profile=OuterRef("pk"), target=current_profile
+    )
+    rows = list(
+        profiles.annotate(
+            last_active=Coalesce("last_login", "created_at"),
+            photos=Count("photo"),
+            liked_me=Exists(liked_me),
+        ).values_list("id", "location", "age", "last_active", "photos", "liked_me")
+    )
+    if not rows:
+        return []
+
+    return rank([row[0] for row in rows], get_features(current_profile, rows), radius)
+
+
+"""
+    Order the groups of the swipe by score, the group is scored by its owner
+    and it has liked_me when any member has liked the current profile
+    @param current_profile: the profile that swipes
+    @param groups: queryset of groups already filtered
+    @param radius: the search radius in km
+    @return: list of the group ids ordered by score
+"""
+
+
+def rank_groups(current_profile, groups, radius):
+    liked_me = models.Like.objects.filter(
+        target=current_profile,
+        profile__in=models.Group.members.through.objects.filter(
+            group=OuterRef(OuterRef("pk"))
+        ).values("profile"),
+    )
+    rows = list(
+        groups.annotate(
+            last_active=Coalesce("owner__last_login", "owner__created_at"),
+            photos=Count("owner__photo"),
+            liked_me=Exists(liked_me),
+        ).values_list(
+            "id", "owner__location", "age", "last_active", "photos", "liked_me"
+        )
+    )
+    if not rows:
+        return []
+
+    return rank([row[0] for row in rows], get_features(current_profile, rows), radius)
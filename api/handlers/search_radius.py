@@ -0,0 +1,61 @@
+"""
+    Adaptive search radius for the swipe
+
+    Instead of the fixed radius, the radius grows or shrinks through the steps of
+    SWIPE_RADIUS_STEPS_KM until the deck has SWIPE_TARGET_DECK_SIZE cards. The
+    radius found is cached for the geo cell of the profile, so the next search
+    in the same area starts from it instead of from scratch.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+RADIUS_KEY = "swipe:radius:{}:{}"
+
+
+"""
+    Returns the cache key of the geo cell that contains the location
+    @param location: the point of the profile
+    @return: the cache key of the cell
+"""
+
+
+def get_cell_key(location):
+    cell_size = settings.SWIPE_RADIUS_CELL_DEGREES
+    return RADIUS_KEY.format(
+        int(location.x // cell_size),
+        int(location.y // cell_size),
+    )
+
+
+"""
+    Find the smallest radius step that reaches the target deck size
+    @param location: the point of the current profile
+    @param count_cards: function (radius_km, limit) -> number of eligible cards,
+    it only needs to count up to the limit
+    @return: the radius in km
+"""
+
+
+def get_adaptive_radius(location, count_cards):
+    steps = settings.SWIPE_RADIUS_STEPS_KM
+    target = settings.SWIPE_TARGET_DECK_SIZE
+    cell_key = get_cell_key(location)
+
+    # start from the radius used last time in this area
+    cached_radius = cache.get(cell_key, settings.SWIPE_RADIUS_KM)
+    index = min(range(len(steps)), key=lambda i: abs(steps[i] - cached_radius))
+
+    if count_cards(steps[index], target) < target:
+        # expand until the target is reached or the max radius
+        while index < len(steps) - 1:
+            index += 1
+            if count_cards(steps[index], target) >= target:
+                break
+    else:
+        # shrink while the smaller radius still reaches the target
+        while index > 0 and count_cards(steps[index - 1], target) >= target:
+            index -= 1
+
+    cache.set(cell_key, steps[index], settings.SWIPE_RADIUS_CACHE_TIMEOUT)
+    return steps[index]
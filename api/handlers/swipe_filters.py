@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.utils.timezone import now
+from django.db.models import Exists, OuterRef, Q
 from datetime import date
+from api import models
 
 
 def age_range(data, min_age, max_age):
@@ -10,6 +13,23 @@ def age_range(data, min_age, max_age):
     return data.filter(birthdate__gte=max_date, birthdate__lte=min_date)
 
 
+# Ages of the single profiles shown to a profile of this age
+def get_age_range(profile_age):
+    if profile_age == 18 or profile_age == 19:
+        return profile_age - 1, profile_age + 6
+    return profile_age - 5, profile_age + 5
+
+
+# Passes of the current profile that still hide the target from the swipe
+def recent_passes(current_profile):
+    passes = models.SwipeEvent.objects.filter(
+        profile=current_profile, kind=models.SwipeEvent.KINDS.PASS
+    )
+    if settings.SWIPE_PASS_TTL is not None:
+        passes = passes.filter(created_at__gte=now() - settings.SWIPE_PASS_TTL)
+    return passes
+
+
 # Profiles already filtered by distance
 def filter_profiles(current_profile, profiles):
     profile_age = current_profile.age
@@ -34,18 +54,18 @@ def filter_profiles(current_profile, profiles):
         show_profiles = show_profiles.exclude(id__in=blocked_by_profiles)
 
     # Show profiles between in a range of ages
-    if profile_age == 18 or profile_age == 19:
-        show_profiles = age_range(show_profiles, profile_age - 1, profile_age + 6)
-    else:
-        show_profiles = age_range(show_profiles, profile_age - 5, profile_age + 5)
+    show_profiles = age_range(show_profiles, *get_age_range(profile_age))
 
     # exclude the current user in the swipe
     show_profiles = show_profiles.exclude(id=current_profile.id)
 
-    # filter liked profiles
-    profiles_already_liked = current_profile.liked_by.filter(id__in=show_profiles)
     # exclude profiles already liked
-    show_profiles = show_profiles.exclude(id__in=profiles_already_liked)
+    likes = models.Like.objects.filter(profile=current_profile)
+    show_profiles = show_profiles.filter(~Exists(likes.filter(target=OuterRef("pk"))))
+
+    # exclude profiles passed recently
+    passes = recent_passes(current_profile)
+    show_profiles = show_profiles.filter(~Exists(passes.filter(target=OuterRef("pk"))))
 
     return show_profiles
 
@@ -53,8 +73,9 @@ def filter_profiles(current_profile, profiles):
 # Groups already filtered by distance
 def filter_groups(current_profile, groups):
     profile_age = current_profile.age
-    blocked_profiles = current_profile.blocked_profiles.all()
     show_gender = current_profile.show_me
+    members = models.Group.members.through.objects.filter(group=OuterRef("pk"))
+    likes = models.Like.objects.filter(group=OuterRef("pk"))
 
     # filter by gender
     if show_gender == "X":
@@ -63,22 +84,15 @@ def filter_groups(current_profile, groups):
         show_groups = groups.filter(gender=show_gender)
 
     # if the user in a group, don't show their group in the swipe
-    if current_profile.member_group.all().exists():
-        for group in groups:
-            if group.members.filter(id=current_profile.id).exists():
-                show_groups = show_groups.exclude(id=group.id)
+    show_groups = show_groups.filter(~Exists(members.filter(profile=current_profile)))
 
     # exclude groups that has any blocked profile in their members
-    for group in groups:
-        for blocked_profile in blocked_profiles:
-            if group.members.filter(id=blocked_profile.id).exists():
-                show_groups = show_groups.exclude(id=group.id)
-
-        # exclude any group that contains a member that has blocked the current user
-        if current_profile.blocked_by.all().exists():
-            for blocked_by_profile in current_profile.blocked_by.all():
-                if group.members.filter(id=blocked_by_profile.id).exists():
-                    show_groups = show_groups.exclude(id=group.id)
+    # and any group that contains a member that has blocked the current user
+    blocked_members = members.filter(
+        Q(profile__in=current_profile.blocked_profiles.all())
+        | Q(profile__in=current_profile.blocked_by.all())
+    )
+    show_groups = show_groups.filter(~Exists(blocked_members))
 
     # show groups between in a range of age
     if profile_age == 18 or profile_age == 19:
@@ -92,10 +106,13 @@ def filter_groups(current_profile, groups):
     # the group needs a minimum of two members to be displayed
     show_groups = show_groups.filter(total_members__gte=2)
 
-    # filter all the groups that has a like from the current profile
-    groups_liked_by_current_profile = show_groups.filter(likes=current_profile.id)
+    # exclude the groups that has a like from the current profile
+    show_groups = show_groups.filter(~Exists(likes.filter(profile=current_profile)))
 
-    # exclude liked groups
-    show_groups = show_groups.exclude(id__in=groups_liked_by_current_profile)
+    # exclude the groups with a member passed recently
+    passes = recent_passes(current_profile)
+    show_groups = show_groups.filter(
+        ~Exists(members.filter(profile__in=passes.values("target")))
+    )
 
     return show_groups
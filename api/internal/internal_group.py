@@ -109,7 +109,7 @@ def generate_groups(request):
         for member in members_to_add:
             group.members.add(member)
             member.is_in_group = True
-            member.save()
+            member.save(update_fields=["is_in_group"])
 
         group.save()
         group_list.append(group)
@@ -137,7 +137,7 @@ def delete_all_groups(request):
     for group in groups:
         for member in group.members.all():
             member.is_in_group = False
-            member.save()
+            member.save(update_fields=["is_in_group"])
 
         group.delete()
 
@@ -175,7 +175,7 @@ def ungroup_users(request):
             if group.created_at < timezone.now() - timedelta(days=1):
                 for member in group.members.all():
                     member.is_in_group = False
-                    member.save()
+                    member.save(update_fields=["is_in_group"])
                 group.delete()
                 ungroupped += 1
 
@@ -62,15 +62,15 @@ def generate_likes(request):
         )
 
     # current user likes
-    likes = current_user.likes.all()
+    likes = models.Like.objects.filter(target=current_user)
 
     # profiles liked by current user
-    liked_by = current_user.liked_by.all()
+    liked_by = models.Like.objects.filter(profile=current_user, target__isnull=False)
 
     # to exclude the likes that the user already have and the likes he has already gave to other profiles
     ids_to_exclude = set(
-        list(likes.values_list("likes__id", flat=True))
-        + list(liked_by.values_list("liked_by__id", flat=True))
+        list(likes.values_list("profile", flat=True))
+        + list(liked_by.values_list("target", flat=True))
     )
 
     # exclude here
@@ -80,13 +80,13 @@ def generate_likes(request):
 
     profiles_likes = []
     for i in range(20):
-        current_user.likes.add(profiles_no_in_group[i])
+        models.Like.objects.add(profiles_no_in_group[i], target=current_user)
         profiles_likes.append(profiles_no_in_group[i])
 
     group_likes = []
     for i in range(10):
         member = groups[i].owner
-        current_user.likes.add(member)
+        models.Like.objects.add(member, target=current_user)
         group_likes.append(groups[i])
 
     groups_serializer = serializers.SwipeGroupSerializer(group_likes, many=True)
@@ -109,12 +109,9 @@ def generate_likes(request):
 @permission_classes([IsAdminUser])
 def remove_all_likes(request):
     current_user = request.user
-    likes = current_user.likes.all()
+    removed, _ = models.Like.objects.filter(target=current_user).delete()
 
-    for like in likes:
-        current_user.likes.remove(like)
-
-    return Response({"detail": f"{likes.count()} profiles removed from likes"})
+    return Response({"detail": f"{removed} profiles removed from likes"})
 
 
 # * Unlike all
@@ -122,9 +119,8 @@ def remove_all_likes(request):
 @permission_classes([IsAdminUser])
 def unlike_all(request):
     current_user = request.user
-    liked_by_current = current_user.liked_by.all()
-
-    for profile in liked_by_current:
-        profile.likes.remove(current_user)
+    unliked, _ = models.Like.objects.filter(
+        profile=current_user, target__isnull=False
+    ).delete()
 
-    return Response({"detail": f"{liked_by_current.count()} profiles unliked"})
+    return Response({"detail": f"{unliked} profiles unliked"})
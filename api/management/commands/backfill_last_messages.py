@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from api import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Set the last_message and last_message_at of the conversations from their "
+        "messages, in batches of conversations. Run it once after migrating the "
+        "fields, the messages written later keep them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_message = models.Message.objects.filter(
+            conversation=OuterRef("pk")
+        ).order_by("-sent_at")
+
+        conversations = models.Conversation.objects.order_by("id").values_list(
+            "id", flat=True
+        )
+        start = time.perf_counter()
+        updated = 0
+        last_id = None
+
+        while True:
+            batch = conversations.filter(id__gt=last_id) if last_id else conversations
+            ids = list(batch[: options["batch_size"]])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            with transaction.atomic():
+                models.Conversation.objects.filter(id__in=ids).update(
+                    last_message=Subquery(last_message.values("id")[:1]),
+                    last_message_at=Subquery(last_message.values("sent_at")[:1]),
+                )
+            updated += len(ids)
+            self.stdout.write(
+                f"{updated} conversations updated ({time.perf_counter() - start:.1f}s)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"{updated} conversations updated"))
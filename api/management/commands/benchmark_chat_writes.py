@@ -0,0 +1,98 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from api import models
+import api.handlers.message_buffer as message_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the chat messages per second of one worker when every message "
+        "is inserted before its broadcast and with the write-behind buffer. The "
+        "generated profiles and conversation are deleted at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        # senders writing at the same time in the event loop
+        parser.add_argument("--clients", type=int, default=20)
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError("This command cannot be run in production")
+
+        clients = options["clients"]
+        per_client = options["messages"] // clients
+        total = per_client * clients
+
+        profiles = [self.create_profile(), self.create_profile()]
+        conversation = models.Conversation.objects.create()
+        conversation.participants.set(profiles)
+
+        try:
+            for write_behind in (False, True):
+                with override_settings(CHAT_WRITE_BEHIND=write_behind):
+                    sent, saved = asyncio.run(
+                        self.run(conversation, profiles, clients, per_client)
+                    )
+
+                messages = models.Message.objects.filter(conversation=conversation)
+                written = messages.count()
+                messages.delete()
+
+                mode = "write-behind" if write_behind else "insert per message"
+                self.stdout.write(
+                    f"{mode}: {total / sent:.0f} messages/s sent, "
+                    f"{total / saved:.0f} messages/s saved, {written}/{total} saved"
+                )
+        finally:
+            models.Conversation.objects.filter(id=conversation.id).delete()
+            models.Profile.objects.filter(
+                id__in=[profile.id for profile in profiles]
+            ).delete()
+
+    async def run(self, conversation, profiles, clients, per_client):
+        async def send(sender):
+            for i in range(per_client):
+                # the persistence path of ChatConsumer.receive
+                if settings.CHAT_WRITE_BEHIND:
+                    message_buffer.add(
+                        models.Message(
+                            conversation=conversation, sender=sender, message="ping"
+                        )
+                    )
+                else:
+                    await sync_to_async(models.Message.objects.create)(
+                        conversation=conversation, sender=sender, message="ping"
+                    )
+                # the broadcast of the consumer yields to the other clients
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[send(profiles[i % 2]) for i in range(clients)])
+        sent = time.perf_counter() - start
+
+        # wait until the buffer is saved
+        await message_buffer.flush()
+        tasks = [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        saved = time.perf_counter() - start
+
+        return sent, saved
+
+    def create_profile(self):
+        profile_id = uuid.uuid4()
+        return models.Profile.objects.create(
+            id=profile_id,
+            email=f"{profile_id.hex}@benchmark.local",
+            has_account=True,
+            age=25,
+        )
@@ -0,0 +1,116 @@
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api import models
+import api.handlers.swipe_filters as swipefilters
+
+MEMBERS_PER_GROUP = 3
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the query count and latency of filter_groups while the number "
+        "of nearby groups and blocked profiles grows. The generated data is "
+        "rolled back at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--groups", nargs="+", type=int, default=[50, 200, 800, 3200]
+        )
+        parser.add_argument("--blocks", nargs="+", type=int, default=[0, 25, 100, 400])
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError("This command cannot be run in production")
+
+        self.stdout.write(f"{'groups':>8} {'blocks':>8} {'queries':>8} {'ms':>10}")
+
+        for num_groups in options["groups"]:
+            for num_blocks in options["blocks"]:
+                with transaction.atomic():
+                    current_profile = self.generate_data(num_groups, num_blocks)
+                    queries, elapsed = self.measure(current_profile, options["repeat"])
+                    transaction.set_rollback(True)
+
+                self.stdout.write(
+                    f"{num_groups:>8} {num_blocks:>8} {queries:>8} {elapsed:>10.2f}"
+                )
+
+    def measure(self, current_profile, repeat):
+        groups = models.Group.objects.all()
+        timings = []
+
+        for i in range(repeat):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                list(
+                    swipefilters.filter_groups(current_profile, groups).values_list(
+                        "id", flat=True
+                    )
+                )
+                timings.append((time.perf_counter() - start) * 1000)
+
+        return len(context.captured_queries), sorted(timings)[len(timings) // 2]
+
+    def generate_data(self, num_groups, num_blocks):
+        location = Point(-0.1276, 51.5072, srid=4326)
+        age = 25
+        birthdate = date.today() - timedelta(days=age * 365)
+
+        def new_profile(gender):
+            return models.Profile(
+                email=f"{uuid.uuid4().hex}@benchmark.local",
+                has_account=True,
+                location=location,
+                birthdate=birthdate,
+                age=age,
+                gender=gender,
+                show_me="X",
+            )
+
+        current_profile = new_profile("M")
+        current_profile.save()
+
+        members = models.Profile.objects.bulk_create(
+            [new_profile("W") for i in range(num_groups * MEMBERS_PER_GROUP)]
+        )
+
+        groups = models.Group.objects.bulk_create(
+            [
+                models.Group(
+                    owner=members[i * MEMBERS_PER_GROUP],
+                    gender="W",
+                    age=age,
+                    total_members=MEMBERS_PER_GROUP,
+                    share_link=f"benchmark/{uuid.uuid4().hex}",
+                )
+                for i in range(num_groups)
+            ]
+        )
+
+        models.Group.members.through.objects.bulk_create(
+            [
+                models.Group.members.through(
+                    group=group, profile=members[i * MEMBERS_PER_GROUP + j]
+                )
+                for i, group in enumerate(groups)
+                for j in range(MEMBERS_PER_GROUP)
+            ]
+        )
+
+        # half of the blocks are given by the current profile, half received
+        blocked = members[: num_blocks // 2]
+        blocked_by = members[num_blocks // 2 : num_blocks]
+        current_profile.blocked_profiles.add(*blocked)
+        current_profile.blocked_by.add(*blocked_by)
+
+        return current_profile
@@ -0,0 +1,112 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import models
+import api.handlers.geo_index as geo_index
+
+# synthetic profiles are spread around London
+CENTER = (-0.1276, 51.5072)
+SPREAD_DEGREES = 1.5
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the candidate lookup of the in-process geo index with the "
+        "PostGIS distance query. With --database the profiles are also inserted "
+        "in a transaction that is rolled back at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profiles", nargs="+", type=int, default=[100_000, 1_000_000]
+        )
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--radius", type=float, default=settings.SWIPE_RADIUS_KM)
+        parser.add_argument("--database", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["database"] and not settings.DEBUG:
+            raise CommandError("This command cannot be run in production")
+
+        for size in options["profiles"]:
+            rows = [self.random_row() for i in range(size)]
+            points = [self.random_point() for i in range(options["queries"])]
+
+            start = time.perf_counter()
+            index = geo_index.GeoGridIndex(settings.SWIPE_GEO_INDEX_CELL_DEGREES)
+            for row in rows:
+                index.upsert(*row)
+            build = time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = sum(
+                len(index.query(lon, lat, options["radius"], gender="W"))
+                for lon, lat in points
+            )
+            elapsed = (time.perf_counter() - start) * 1000 / len(points)
+
+            self.stdout.write(
+                f"{size} profiles - index: build {build:.1f}s, "
+                f"{elapsed:.2f} ms/query, {found // len(points)} candidates/query"
+            )
+
+            if options["database"]:
+                with transaction.atomic():
+                    self.insert_profiles(rows)
+                    elapsed = self.measure_database(points, options["radius"])
+                    transaction.set_rollback(True)
+
+                self.stdout.write(f"{size} profiles - postgis: {elapsed:.2f} ms/query")
+
+    def random_point(self):
+        return (
+            CENTER[0] + random.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+            CENTER[1] + random.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+        )
+
+    def random_row(self):
+        lon, lat = self.random_point()
+        return (
+            uuid.uuid4(),
+            lon,
+            lat,
+            random.randint(18, 60),
+            random.choice("MW"),
+            random.random() < 0.2,
+        )
+
+    def insert_profiles(self, rows):
+        models.Profile.objects.bulk_create(
+            [
+                models.Profile(
+                    id=profile_id,
+                    email=f"{profile_id.hex}@benchmark.local",
+                    has_account=True,
+                    location=Point(lon, lat, srid=4326),
+                    age=age,
+                    gender=gender,
+                    is_in_group=is_in_group,
+                )
+                for profile_id, lon, lat, age, gender, is_in_group in rows
+            ],
+            batch_size=5000,
+        )
+
+    def measure_database(self, points, radius):
+        start = time.perf_counter()
+        for lon, lat in points:
+            list(
+                models.Profile.objects.filter(
+                    has_account=True,
+                    gender="W",
+                    location__distance_lt=(Point(lon, lat, srid=4326), D(km=radius)),
+                ).values_list("id", flat=True)
+            )
+        return (time.perf_counter() - start) * 1000 / len(points)
@@ -0,0 +1,82 @@
+import math
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+import api.handlers.ranking as ranking
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the numpy scoring of the swipe ranking with a pure python "
+        "baseline on synthetic candidates"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--candidates", nargs="+", type=int, default=[500, 5000])
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        radius = settings.SWIPE_RADIUS_KM
+        weights = settings.SWIPE_RANKING_WEIGHTS
+
+        for size in options["candidates"]:
+            ids = list(range(size))
+            features = {
+                "distance": np.random.uniform(0, radius, size),
+                "age_gap": np.random.randint(0, 6, size).astype(float),
+                "inactive_days": np.random.exponential(5, size),
+                "photos": np.random.randint(0, 6, size).astype(float),
+                "liked_me": (np.random.random(size) < 0.1).astype(float),
+            }
+            rows = [
+                {name: float(values[i]) for name, values in features.items()}
+                for i in range(size)
+            ]
+
+            numpy_ms = self.measure(
+                lambda: ranking.rank(ids, features, radius), options["repeat"]
+            )
+            python_ms = self.measure(
+                lambda: self.rank_python(ids, rows, radius, weights), options["repeat"]
+            )
+
+            # both implementations must give the same order
+            numpy_order = ranking.rank(ids, features, radius)
+            python_order = self.rank_python(ids, rows, radius, weights)
+            different = sum(
+                1 for a, b in zip(numpy_order, python_order) if a != b
+            ) + abs(len(numpy_order) - len(python_order))
+
+            self.stdout.write(
+                f"{size} candidates - numpy: {numpy_ms:.2f} ms, "
+                f"python: {python_ms:.2f} ms, "
+                f"same order: {numpy_order == python_order} "
+                f"({different} positions differ)"
+            )
+
+    def measure(self, function, repeat):
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    def rank_python(self, ids, rows, radius, weights):
+        scores = []
+        for row in rows:
+            scores.append(
+                weights["distance"] * (1 - min(row["distance"] / radius, 1))
+                + weights["age"] * (1 - min(row["age_gap"] / ranking.AGE_SCALE, 1))
+                + weights["recency"]
+                * math.exp(-row["inactive_days"] / ranking.RECENCY_DAYS)
+                + weights["photos"]
+                * min(row["photos"], ranking.MAX_PHOTOS)
+                / ranking.MAX_PHOTOS
+                + weights["liked_me"] * row["liked_me"]
+            )
+        order = sorted(range(len(ids)), key=lambda i: -scores[i])
+        return [ids[i] for i in order]
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest, Least
+
+from api import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Store every match as the ordered pair (profile1 < profile2) and remove "
+        "the duplicated matches of the same pair, keeping the oldest one. Run it "
+        "before migrating the unique_match_pair constraint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            duplicated_pairs = (
+                models.Match.objects.annotate(
+                    low=Least("profile1", "profile2"),
+                    high=Greatest("profile1", "profile2"),
+                )
+                .values("low", "high")
+                .annotate(total=Count("id"))
+                .filter(total__gt=1)
+            )
+
+            removed = 0
+            for pair in duplicated_pairs:
+                low, high = pair["low"], pair["high"]
+                kept, *duplicates = models.Match.objects.filter(
+                    Q(profile1=low, profile2=high) | Q(profile1=high, profile2=low)
+                ).order_by("created_at")
+
+                # the groups of the duplicated matches keep the oldest match
+                for group in models.Group.objects.filter(matches__in=duplicates):
+                    group.matches.add(kept)
+
+                models.Match.objects.filter(
+                    id__in=[match.id for match in duplicates]
+                ).delete()
+                removed += len(duplicates)
+
+            swapped = models.Match.objects.filter(profile1__gt=F("profile2")).update(
+                profile1=F("profile2"), profile2=F("profile1")
+            )
+
+            self.stdout.write(
+                f"{removed} duplicated matches removed, {swapped} matches reordered"
+            )
+
+            if options["dry_run"]:
+                transaction.set_rollback(True)
+                self.stdout.write("Dry run, the changes were rolled back")
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.contrib.gis.measure import D
+from django.core.management.base import BaseCommand
+
+from api import models
+import api.handlers.geo_index as geo_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Check the in-process geo index against the PostGIS distance query "
+        "for a sample of profiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=100)
+        parser.add_argument("--radius", type=float, default=settings.SWIPE_RADIUS_KM)
+
+    def handle(self, *args, **options):
+        radius = options["radius"]
+        index = geo_index.build_index()
+        self.stdout.write(f"Index built with {len(index)} profiles")
+
+        profiles = models.Profile.objects.filter(
+            has_account=True, location__isnull=False
+        )
+        samples = profiles.order_by("?")[: options["samples"]]
+
+        failed = 0
+        for profile in samples:
+            location = profile.location
+            gender = None if profile.show_me == "X" else profile.show_me
+
+            index_ids = set(
+                index.query(
+                    location.x,
+                    location.y,
+                    radius,
+                    gender=gender,
+                    min_age=profile.age - 5 if profile.age else None,
+                    max_age=profile.age + 5 if profile.age else None,
+                    is_in_group=False,
+                )
+            )
+
+            database_profiles = profiles.filter(
+                location__distance_lt=(location, D(km=radius)), is_in_group=False
+            )
+            if gender:
+                database_profiles = database_profiles.filter(gender=gender)
+            if profile.age:
+                database_profiles = database_profiles.filter(
+                    age__gte=profile.age - 5, age__lte=profile.age + 5
+                )
+            database_ids = set(database_profiles.values_list("id", flat=True))
+
+            if index_ids != database_ids:
+                failed += 1
+                self.stdout.write(
+                    f"{profile.id}: {len(index_ids - database_ids)} only in the "
+                    f"index, {len(database_ids - index_ids)} only in the database"
+                )
+
+        if failed:
+            self.stdout.write(self.style.ERROR(f"{failed} profiles do not match"))
+        else:
+            self.stdout.write(self.style.SUCCESS("The index matches the database"))
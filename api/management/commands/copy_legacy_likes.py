@@ -0,0 +1,93 @@
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from api import models
+
+# date of the legacy likes that have no swipe event
+LEGACY_LIKE_DATE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the likes of the legacy many to many tables (Profile.likes and "
+        "Group.likes) to the Like model, in batches. The like is dated by its "
+        "swipe event when there is one. The likes already copied are skipped, "
+        "so it can run again until the legacy fields are removed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        likes = models.SwipeEvent.objects.filter(
+            kind=models.SwipeEvent.KINDS.LIKE
+        ).order_by("-created_at")
+
+        # Profile.likes of a profile are the profiles that like it
+        profile_likes = models.Profile.likes.through.objects.annotate(
+            liked_at=Coalesce(
+                Subquery(
+                    likes.filter(
+                        profile=OuterRef("to_profile"), target=OuterRef("from_profile")
+                    ).values("created_at")[:1]
+                ),
+                Value(LEGACY_LIKE_DATE),
+            )
+        ).values_list("id", "to_profile", "from_profile", "liked_at")
+        copied = self.copy(
+            profile_likes,
+            lambda profile, target, liked_at: models.Like(
+                profile_id=profile, target_id=target, created_at=liked_at
+            ),
+            options["batch_size"],
+        )
+        self.stdout.write(f"{copied} legacy profile likes processed")
+
+        # the swipe event of a group like targets one of its members
+        members = models.Group.members.through.objects.filter(
+            group=OuterRef(OuterRef("group"))
+        )
+        group_likes = models.Group.likes.through.objects.annotate(
+            liked_at=Coalesce(
+                Subquery(
+                    likes.filter(
+                        profile=OuterRef("profile"),
+                        target__in=members.values("profile"),
+                    ).values("created_at")[:1]
+                ),
+                Value(LEGACY_LIKE_DATE),
+            )
+        ).values_list("id", "profile", "group", "liked_at")
+        copied = self.copy(
+            group_likes,
+            lambda profile, group, liked_at: models.Like(
+                profile_id=profile, group_id=group, created_at=liked_at
+            ),
+            options["batch_size"],
+        )
+        self.stdout.write(f"{copied} legacy group likes processed")
+
+        self.stdout.write(self.style.SUCCESS("Legacy likes copied"))
+
+    def copy(self, rows, build_like, batch_size):
+        # keyset on the id of the legacy rows
+        rows = rows.order_by("id")
+        copied = 0
+        last_id = None
+
+        while True:
+            batch = rows.filter(id__gt=last_id) if last_id else rows
+            batch = list(batch[:batch_size])
+            if not batch:
+                return copied
+            last_id = batch[-1][0]
+
+            # bulk_create does not send post_save, the counters already count
+            # the legacy likes
+            models.Like.objects.bulk_create(
+                [build_like(*row[1:]) for row in batch], ignore_conflicts=True
+            )
+            copied += len(batch)
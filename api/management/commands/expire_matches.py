@@ -0,0 +1,85 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from api import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the matches older than MATCH_EXPIRATION that have no conversation. "
+        "The matches are deleted in small batches, each one in its own short "
+        "transaction, so the match table is never locked for long. Schedule it "
+        "daily, e.g. with the Heroku Scheduler"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.MATCH_EXPIRATION.days)
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.MATCH_EXPIRATION_BATCH_SIZE
+        )
+        # pause between batches to leave room to the requests
+        parser.add_argument("--sleep", type=float, default=0.1)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        expiration = timezone.now() - timezone.timedelta(days=options["days"])
+
+        conversations = models.Conversation.objects.filter(
+            participants=OuterRef("profile1")
+        ).filter(participants=OuterRef("profile2"))
+        expired = (
+            models.Match.objects.filter(created_at__lt=expiration)
+            .filter(~Exists(conversations))
+            .order_by("created_at", "id")
+        )
+
+        start = time.perf_counter()
+        batches = 0
+        deleted = 0
+        last = None
+
+        while True:
+            # keyset over (created_at, id), the matches kept are not read again
+            batch = expired
+            if last:
+                batch = batch.filter(
+                    Q(created_at__gt=last[0]) | Q(created_at=last[0], id__gt=last[1])
+                )
+            rows = list(batch.values_list("created_at", "id")[: options["batch_size"]])
+            if not rows:
+                break
+
+            last = rows[-1]
+            batches += 1
+
+            if options["dry_run"]:
+                deleted += len(rows)
+            else:
+                # check the conversation again, it may have started meanwhile
+                with transaction.atomic():
+                    total, per_model = expired.filter(
+                        id__in=[row[1] for row in rows]
+                    ).delete()
+                deleted += per_model.get("api.Match", 0)
+
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"batch {batches}: {deleted} matches expired "
+                f"({deleted / elapsed:.0f}/s, {elapsed:.1f}s)"
+            )
+
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+
+        verb = "would be expired" if options["dry_run"] else "expired"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{deleted} matches {verb} in {batches} batches, "
+                f"{time.perf_counter() - start:.1f}s"
+            )
+        )
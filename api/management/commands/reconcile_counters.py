@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, IntegerField, OuterRef, Q, Subquery
+
+from api import models
+
+
+class SubqueryCount(Subquery):
+    template = "(SELECT COUNT(*) FROM (%(subquery)s) _count)"
+    output_field = IntegerField()
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the likes_count and matches_count of the profiles from the "
+        "likes and matches tables, in batches of profiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        matches = models.Match.objects.filter(
+            Q(profile1=OuterRef("pk")) | Q(profile2=OuterRef("pk"))
+        ).values("id")
+
+        # likes of the profile from profiles that have not matched with it
+        pair_matches = models.Match.objects.filter(
+            Q(profile1=OuterRef("profile"), profile2=OuterRef("target"))
+            | Q(profile1=OuterRef("target"), profile2=OuterRef("profile"))
+        )
+        likes = (
+            models.Like.objects.filter(target=OuterRef("pk"))
+            .filter(~Exists(pair_matches))
+            .values("id")
+        )
+
+        profiles = models.Profile.objects.order_by("id").values_list("id", flat=True)
+        start = time.perf_counter()
+        updated = 0
+        last_id = None
+
+        while True:
+            batch = profiles.filter(id__gt=last_id) if last_id else profiles
+            ids = list(batch[: options["batch_size"]])
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            with transaction.atomic():
+                models.Profile.objects.filter(id__in=ids).update(
+                    likes_count=SubqueryCount(likes),
+                    matches_count=SubqueryCount(matches),
+                )
+            updated += len(ids)
+            self.stdout.write(
+                f"{updated} profiles reconciled ({time.perf_counter() - start:.1f}s)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"{updated} profiles reconciled"))
@@ -0,0 +1,79 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+import api.handlers.jobs as jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker of the background jobs (JOBS_BACKEND = database). Runs up to "
+        "--concurrency jobs at the same time, many workers can run in parallel"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4)
+        # seconds to wait when there are no jobs ready
+        parser.add_argument("--poll", type=float, default=2)
+        # run the jobs ready and exit
+        parser.add_argument("--once", action="store_true")
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: self.stopping.set())
+
+        # free slots of the pool, a job is claimed only when it can start
+        slots = threading.Semaphore(concurrency)
+        self.stdout.write(f"Worker started with {concurrency} threads")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while not self.stopping.is_set():
+                    free = self.count_free_slots(slots, concurrency)
+                    claimed = jobs.claim_jobs(free) if free else []
+
+                    for i in range(free - len(claimed)):
+                        slots.release()
+                    for job in claimed:
+                        executor.submit(self.run, job, slots)
+
+                    if not claimed:
+                        if options["once"] and free == concurrency:
+                            break
+                        time.sleep(options["poll"])
+            except KeyboardInterrupt:
+                pass
+
+            self.stdout.write("Waiting for the running jobs")
+
+        connection.close()
+
+    def count_free_slots(self, slots, concurrency):
+        # wait for the first free slot, then take the other free ones
+        free = 0
+        while free < concurrency:
+            if free == 0:
+                acquired = slots.acquire(timeout=1)
+            else:
+                acquired = slots.acquire(blocking=False)
+            if not acquired:
+                break
+            free += 1
+        return free
+
+    def run(self, job, slots):
+        try:
+            start = time.perf_counter()
+            done = jobs.run_job(job)
+            elapsed = (time.perf_counter() - start) * 1000
+            state = "done" if done else f"failed (attempt {job.attempts})"
+            self.stdout.write(f"{job.name} {job.id}: {state} in {elapsed:.0f} ms")
+        finally:
+            # every thread has its own database connection
+            connection.close()
+            slots.release()
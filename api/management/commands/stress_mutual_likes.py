@@ -0,0 +1,97 @@
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+from api import models
+import api.handlers.matchmaking as matchmaking
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire simultaneous mutual likes from threads and check that every pair "
+        "ends with exactly one match. The generated profiles are deleted at the end"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pairs", type=int, default=20)
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG:
+            raise CommandError("This command cannot be run in production")
+
+        failed = 0
+        details = Counter()
+
+        for i in range(options["rounds"]):
+            pairs = [
+                (self.create_profile(), self.create_profile())
+                for j in range(options["pairs"])
+            ]
+            try:
+                results = self.like_simultaneously(pairs)
+                details.update(results)
+
+                for profile1, profile2 in pairs:
+                    matches = models.Match.objects.between(profile1, profile2).count()
+                    if matches != 1:
+                        failed += 1
+                        self.stdout.write(
+                            f"{profile1.id} - {profile2.id}: {matches} matches"
+                        )
+            finally:
+                models.Profile.objects.filter(
+                    id__in=[profile.id for pair in pairs for profile in pair]
+                ).delete()
+
+        self.stdout.write(f"Results: {dict(details)}")
+        if failed:
+            self.stdout.write(self.style.ERROR(f"{failed} pairs without one match"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every pair has exactly one match"))
+
+    def create_profile(self):
+        profile_id = uuid.uuid4()
+        return models.Profile.objects.create(
+            id=profile_id,
+            email=f"{profile_id.hex}@stress.local",
+            has_account=True,
+            age=25,
+        )
+
+    def like_simultaneously(self, pairs):
+        barrier = threading.Barrier(len(pairs) * 2)
+        results = []
+        errors = []
+
+        def like(current_profile, liked_profile):
+            request = RequestFactory().post("/")
+            request.user = current_profile
+            try:
+                barrier.wait()
+                response = matchmaking.like(request, current_profile, liked_profile)
+                results.append(response.data["details"])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=like, args=args)
+            for profile1, profile2 in pairs
+            for args in ((profile1, profile2), (profile2, profile1))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise CommandError(f"{len(errors)} likes failed, first error: {errors[0]}")
+
+        return results
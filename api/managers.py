@@ -1,4 +1,7 @@
+import uuid
+
 from django.contrib.auth.base_user import BaseUserManager
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 
 
@@ -33,3 +36,57 @@ class CustomUserManager(BaseUserManager):
         if extra_fields.get("is_superuser") is not True:
             raise ValueError(_("Superuser must have is_superuser=True."))
         return self.create_user(email, password, **extra_fields)
+
+
+class MatchManager(models.Manager):
+    """
+    The match stores the pair of profiles ordered by id (profile1 < profile2),
+    so the match between two profiles is found with one lookup of the unique index
+    """
+
+    @staticmethod
+    def canonical_pair(p1, p2):
+        """
+        Order two profiles (or profile ids) as they are stored in the match.
+        """
+        p1_id = uuid.UUID(str(getattr(p1, "pk", p1)))
+        p2_id = uuid.UUID(str(getattr(p2, "pk", p2)))
+        if p1_id > p2_id:
+            return p2_id, p1_id
+        return p1_id, p2_id
+
+    def between(self, p1, p2):
+        """
+        Queryset with the match between two profiles, empty if they have not matched.
+        """
+        profile1_id, profile2_id = self.canonical_pair(p1, p2)
+        return self.filter(profile1_id=profile1_id, profile2_id=profile2_id)
+
+    def get_or_create_between(self, p1, p2):
+        """
+        Get the match between two profiles or create it, safe against concurrent
+        creation thanks to the unique index of the pair.
+        """
+        profile1_id, profile2_id = self.canonical_pair(p1, p2)
+        return self.get_or_create(profile1_id=profile1_id, profile2_id=profile2_id)
+
+
+class LikeManager(models.Manager):
+    """
+    A like is given by a profile to another profile (target) or to a group,
+    only once for each profile or group
+    """
+
+    def add(self, profile, target=None, group=None):
+        """
+        Like a profile or a group, nothing changes if it is already liked.
+        """
+        return self.get_or_create(profile=profile, target=target, group=group)
+
+    def between(self, p1, p2):
+        """
+        Queryset with the likes given between two profiles in both directions.
+        """
+        return self.filter(
+            models.Q(profile=p1, target=p2) | models.Q(profile=p2, target=p1)
+        )
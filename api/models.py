@@ -5,13 +5,17 @@ from datetime import timedelta
 from django.contrib.gis.db import models
 from model_utils import Choices
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
+from django.contrib.postgres.indexes import GistIndex
+from django.db import transaction
 from django.db.models import Q
 from api.utils.generate import generate_group_code
+from api.utils.geo import to_geography
 
-# from background_task import background
-from .managers import CustomUserManager
+from .managers import CustomUserManager, LikeManager, MatchManager
 
 import api.utils.gets as g
+import api.handlers.deck_cache as deck_cache
+import api.handlers.geo_index as geo_index
 
 
 class Profile(AbstractBaseUser, PermissionsMixin):
@@ -67,31 +71,37 @@ class Profile(AbstractBaseUser, PermissionsMixin):
         "self", symmetrical=False, related_name="blocked_by", blank=True
     )
 
-    # many to many of people that like the current profile
+    # legacy many to many of people that like the current profile, replaced by
+    # Like (copy_legacy_likes copies the rows), nothing reads or writes it
     likes = models.ManyToManyField(
         "self", symmetrical=False, related_name="liked_by", blank=True
     )
 
+    # counters kept by api.handlers.counters, reconcile_counters recomputes them
+    # likes: profiles that like the current profile and have not matched with it
+    likes_count = models.PositiveIntegerField(default=0)
+    matches_count = models.PositiveIntegerField(default=0)
+
     USERNAME_FIELD = "email"
     # requred for creating user
     REQUIRED_FIELDS = []
 
     objects = CustomUserManager()
 
+    class Meta:
+        indexes = [
+            # nearest-first swipe deck, KNNDistance orders by this expression
+            GistIndex(to_geography("location"), name="profile_location_geog_idx"),
+        ]
+
     # profile methods
 
     def block_profile(self, blocked_profile):
         # Remove likes between
-        self.likes.remove(blocked_profile)
-        blocked_profile.likes.remove(self)
+        Like.objects.between(self, blocked_profile).delete()
 
         # Check for existing match between profiles and delete it
-        match_qs = Match.objects.filter(
-            Q(profile1=self, profile2=blocked_profile)
-            | Q(profile1=blocked_profile, profile2=self)
-        )
-        if match_qs.exists():
-            match_qs.delete()
+        Match.objects.between(self, blocked_profile).delete()
 
         # check is there is any conversation between and delete it
         conversation = g.get_conversation_between(self, blocked_profile)
@@ -109,6 +119,13 @@ class Profile(AbstractBaseUser, PermissionsMixin):
             group.save()
 
         self.blocked_profiles.add(blocked_profile)
+        deck_cache.invalidate(self.id, blocked_profile.id)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # a rolled back save does not change the index
+        if geo_index.is_enabled():
+            transaction.on_commit(lambda: geo_index.update_profile(self))
 
     def delete(self):
         conversations = Conversation.objects.filter(participants=self)
@@ -117,6 +134,9 @@ class Profile(AbstractBaseUser, PermissionsMixin):
             for conv in conversations:
                 conv.delete()
 
+        if geo_index.is_enabled():
+            profile_id = self.id
+            transaction.on_commit(lambda: geo_index.remove_profile(profile_id))
         super().delete()
 
 
@@ -156,21 +176,65 @@ class Match(models.Model):
     )
     created_at = models.DateTimeField(default=timezone.now)
 
-    # @background(schedule=60*60-24)
-    # def delete_old_matches(self):
-    #     """
-    #     Delete matches older than 14 days
-    #     """
-    #     NUMBER_OF_DAYS = 14
+    objects = MatchManager()
+
+    class Meta:
+        constraints = [
+            # one match per pair of profiles, stored as (low id, high id)
+            models.UniqueConstraint(
+                fields=["profile1", "profile2"], name="unique_match_pair"
+            ),
+            models.CheckConstraint(
+                check=Q(profile1__lt=models.F("profile2")), name="match_pair_ordered"
+            ),
+        ]
+        indexes = [
+            # expire_matches scans the old matches by creation date
+            models.Index(fields=["created_at", "id"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        # store the pair ordered by id
+        if self.profile1_id and self.profile2_id:
+            profile1_id, profile2_id = Match.objects.canonical_pair(
+                self.profile1_id, self.profile2_id
+            )
+            if str(profile1_id) != str(self.profile1_id):
+                self.profile1, self.profile2 = self.profile2, self.profile1
+        super().save(*args, **kwargs)
+
+
+class SwipeEvent(models.Model):
+    """
+    Append-only log of the swipes, the passes are excluded from the swipe
+    until SWIPE_PASS_TTL has passed
+    """
+
+    KINDS = Choices(
+        ("LIKE", "like"),
+        ("PASS", "pass"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    profile = models.ForeignKey(
+        Profile, related_name="swipe_events", on_delete=models.CASCADE
+    )
+    target = models.ForeignKey(
+        Profile, related_name="received_swipes", on_delete=models.CASCADE
+    )
+    kind = models.CharField(choices=KINDS, max_length=4)
+    created_at = models.DateTimeField(default=timezone.now)
 
-    #     try:
-    #         old_matches = Match.object.all().filter(
-    #             created__gte=datetime.now()-60*60*24*NUMBER_OF_DAYS
-    #         )
-    #         old_matches.delete()
-    #         print(f"Deleted {len(old_matches)} old matches")
-    #     except Exception as e:
-    #         print(f"Error deleting old matches: {e}")
+    class Meta:
+        indexes = [
+            # anti-join of the swipe filters: recent passes of a profile
+            models.Index(
+                fields=["profile", "target", "created_at"],
+                condition=Q(kind="PASS"),
+                name="swipe_event_pass_idx",
+            ),
+            models.Index(fields=["profile", "created_at"]),
+        ]
 
 
 class Group(models.Model):
@@ -198,6 +262,7 @@ class Group(models.Model):
     members = models.ManyToManyField(Profile, blank=True, related_name="member_group")
 
     matches = models.ManyToManyField(Match, blank=True, related_name="matches")
+    # legacy likes of the group, replaced by Like like Profile.likes
     likes = models.ManyToManyField(Profile, blank=True, related_name="group_likes")
 
     def save(self, *args, **kwargs):
@@ -218,6 +283,61 @@ class Group(models.Model):
         super().save(*args, **kwargs)
 
 
+class Like(models.Model):
+    """
+    Like given by a profile to another profile (target) or to a group, dated so
+    the likes can be listed newest first with range scans of the indexes
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    profile = models.ForeignKey(
+        Profile, related_name="given_likes", on_delete=models.CASCADE
+    )
+    target = models.ForeignKey(
+        Profile,
+        related_name="received_likes",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    group = models.ForeignKey(
+        Group,
+        related_name="received_likes",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = LikeManager()
+
+    class Meta:
+        constraints = [
+            # the like of a profile or the like of a group, never both
+            models.CheckConstraint(
+                check=Q(target__isnull=False, group__isnull=True)
+                | Q(target__isnull=True, group__isnull=False),
+                name="like_target_or_group",
+            ),
+            # the unique indexes are also the lookups of the likes given
+            models.UniqueConstraint(
+                fields=["profile", "target"],
+                condition=Q(group__isnull=True),
+                name="unique_profile_like",
+            ),
+            models.UniqueConstraint(
+                fields=["profile", "group"],
+                condition=Q(group__isnull=False),
+                name="unique_group_like",
+            ),
+        ]
+        indexes = [
+            # likes received by a profile or a group, newest first
+            models.Index(fields=["target", "created_at"]),
+            models.Index(fields=["group", "created_at"]),
+        ]
+
+
 class MyGroupMessage(models.Model):
     """
     The group itself works as a chat_room and this model as its message
@@ -231,6 +351,12 @@ class MyGroupMessage(models.Model):
     message = models.TextField(null=True, blank=True)
     sent_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # keyset pages of the chat history
+            models.Index(fields=["group", "sent_at", "id"]),
+        ]
+
     def get_sent_time(self):
         return self.sent_at.strftime("%I:%M %p")
 
@@ -258,6 +384,26 @@ class Conversation(models.Model):
         blank=True,
     )
 
+    # newest message of the conversation, kept by Message.save for the inbox
+    last_message = models.ForeignKey(
+        "Message",
+        related_name="+",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # inbox: conversations with messages, newest message first
+            models.Index(
+                fields=["-last_message_at", "-id"],
+                condition=Q(last_message_at__isnull=False),
+                name="conversation_inbox_idx",
+            ),
+        ]
+
     def delete(self):
         # delete match and remove like relationship
         participants = self.participants.all()
@@ -277,5 +423,84 @@ class Message(models.Model):
     message = models.TextField(null=True, blank=True)
     sent_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            # keyset pages of the chat history
+            models.Index(fields=["conversation", "sent_at", "id"]),
+        ]
+
     def get_sent_time(self):
         return self.sent_at.strftime("%I:%M %p")
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+
+        if adding:
+            self.set_last_message()
+
+    def set_last_message(self):
+        # the conversation keeps its newest message, an older message written
+        # later does not replace it
+        Conversation.objects.filter(pk=self.conversation_id).filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=self.sent_at)
+        ).update(last_message=self, last_message_at=self.sent_at)
+
+
+class Report(models.Model):
+    """
+    Moderation queue of the reported profiles, the report is sent by email to
+    REPORT_EMAILS in the background
+    """
+
+    STATUS = Choices(
+        ("PENDING", "pending"),
+        ("SENT", "sent"),
+        ("REVIEWED", "reviewed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    reporter = models.ForeignKey(
+        Profile, related_name="reports_made", null=True, on_delete=models.SET_NULL
+    )
+    reported = models.ForeignKey(
+        Profile, related_name="reports_received", on_delete=models.CASCADE
+    )
+    reason = models.TextField(max_length=500, null=True, blank=True)
+    status = models.CharField(choices=STATUS, default=STATUS.PENDING, max_length=10)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+
+class Job(models.Model):
+    """
+    Background job stored in the database, run by the run_jobs worker
+    """
+
+    STATUS = Choices(
+        ("PENDING", "pending"),
+        ("RUNNING", "running"),
+        ("DONE", "done"),
+        ("FAILED", "failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # dotted path of the job function
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(choices=STATUS, default=STATUS.PENDING, max_length=10)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the worker claims the pending jobs by run_at
+            models.Index(fields=["status", "run_at"]),
+        ]
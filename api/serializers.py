@@ -1,6 +1,14 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import (
+    Count,
+    Exists,
+    IntegerField,
+    OuterRef,
+    Prefetch,
+    Subquery,
+)
 from api import models
 
 import api.utils.gets as g
@@ -35,9 +43,6 @@ class PhotoSerializer(serializers.ModelSerializer):
 
 
 class ProfileSerializer(serializers.ModelSerializer):
-    token = serializers.SerializerMethodField(read_only=True)
-    refresh_token = serializers.SerializerMethodField(read_only=True)
-
     # transform the gender and show me into text "Male"
     gender = serializers.CharField(
         source="get_gender_display", required=True, allow_null=False
@@ -49,8 +54,8 @@ class ProfileSerializer(serializers.ModelSerializer):
     photos = PhotoSerializer(source="photo_set", many=True, read_only=True)
 
     is_in_group = serializers.SerializerMethodField()
-    total_likes = serializers.SerializerMethodField()
-    total_matches = serializers.SerializerMethodField()
+    total_likes = serializers.IntegerField(source="likes_count", read_only=True)
+    total_matches = serializers.IntegerField(source="matches_count", read_only=True)
 
     class Meta:
         model = models.Profile
@@ -63,37 +68,24 @@ class ProfileSerializer(serializers.ModelSerializer):
             "is_active",
             "likes",
             "blocked_profiles",
+            "likes_count",
+            "matches_count",
         ]
 
-    # refresh the token everytime the user is called
-    def get_token(self, profile):
-        token = RefreshToken.for_user(profile)
-        return str(token.access_token)
-
-    def get_refresh_token(self, profile):
-        token = RefreshToken.for_user(profile)
-        return str(token)
-
     def get_is_in_group(self, profile):
         return profile.member_group.all().exists()
 
-    def get_total_likes(self, profile):
-        matches = matches = models.Match.objects.filter(
-            Q(profile1=profile.id) | Q(profile2=profile.id)
-        )
-        matched_profiles = [match.profile1.id for match in matches] + [
-            match.profile2.id for match in matches
-        ]
-        likes = profile.likes.exclude(id__in=matched_profiles)
-        count = likes.count()
-        return count
 
-    def get_total_matches(self, profile):
-        matches = matches = models.Match.objects.filter(
-            Q(profile1=profile.id) | Q(profile2=profile.id)
-        )
-        count = matches.count()
-        return count
+# profile with new tokens, only for the auth endpoints (register)
+class AuthProfileSerializer(ProfileSerializer):
+    def to_representation(self, profile):
+        data = super().to_representation(profile)
+
+        # one refresh token for both tokens
+        token = RefreshToken.for_user(profile)
+        data["token"] = str(token.access_token)
+        data["refresh_token"] = str(token)
+        return data
 
 
 # -------------------------- SWIPE SERIALIZERS -----------------------------
@@ -129,8 +121,22 @@ class SwipeProfileSerializer(serializers.ModelSerializer):
         ]
 
     def get_is_in_group(self, profile):
+        # annotated by setup_eager_loading
+        if hasattr(profile, "has_group"):
+            return profile.has_group
         return profile.member_group.all().exists()
 
+    # prefetch plan: the photos ordered and is_in_group in the same query
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.annotate(
+            has_group=Exists(
+                models.Group.members.through.objects.filter(profile=OuterRef("pk"))
+            )
+        ).prefetch_related(
+            Prefetch("photo_set", queryset=models.Photo.objects.order_by("created_at"))
+        )
+
 
 class SwipeGroupSerializer(serializers.ModelSerializer):
     owner = SwipeProfileSerializer(read_only=True, many=False)
@@ -143,6 +149,17 @@ class SwipeGroupSerializer(serializers.ModelSerializer):
         model = models.Group
         fields = ["id", "gender", "total_members", "created_at", "owner", "members"]
 
+    # prefetch plan: the owner and the members with their swipe prefetch plan
+    @staticmethod
+    def setup_eager_loading(queryset):
+        profiles = SwipeProfileSerializer.setup_eager_loading(
+            models.Profile.objects.all()
+        )
+        return queryset.prefetch_related(
+            Prefetch("owner", queryset=profiles),
+            Prefetch("members", queryset=profiles),
+        )
+
 
 # -------------------------- GROUP SERIALIZERS --------------------------------
 class GroupSerializer(serializers.ModelSerializer):
@@ -171,6 +188,31 @@ class GroupSerializerWithLink(GroupSerializer):
     share_link = serializers.CharField(required=True, allow_null=False)
 
 
+# groups annotated with members_count, to prefetch the group of the profiles
+def get_groups_with_count():
+    members = (
+        models.Group.members.through.objects.filter(group=OuterRef("pk"))
+        .order_by()
+        .values("group")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    # a Count("members") would join the members table the prefetch filters on
+    return models.Group.objects.annotate(
+        members_count=Subquery(members, output_field=IntegerField())
+    )
+
+
+# the newest photo of the profiles as recent_photos, to prefetch the photo of the
+# receivers and the senders
+def get_recent_photos():
+    return Prefetch(
+        "photo_set",
+        queryset=models.Photo.objects.order_by("-created_at"),
+        to_attr="recent_photos",
+    )
+
+
 # -------------------------- MATCHED PROFILES SERIALIZERS --------------------------------
 class MatchSerializer(serializers.ModelSerializer):
     current_profile = serializers.SerializerMethodField()
@@ -180,12 +222,26 @@ class MatchSerializer(serializers.ModelSerializer):
         model = models.Match
         fields = ["id", "current_profile", "matched_data"]
 
-    def get_current_profile(self, match):
-        request = self.context.get("request")
-        current_profile = request.user
+    # prefetch plan: both profiles of the match with their swipe prefetch plan and
+    # their group with its members count, for the whole page at once
+    @staticmethod
+    def setup_eager_loading(queryset):
+        profiles = SwipeProfileSerializer.setup_eager_loading(
+            models.Profile.objects.all()
+        ).prefetch_related(Prefetch("member_group", queryset=get_groups_with_count()))
+        return queryset.prefetch_related(
+            Prefetch("profile1", queryset=profiles),
+            Prefetch("profile2", queryset=profiles),
+        )
 
-        serializer = SwipeProfileSerializer(current_profile, many=False)
-        return serializer.data
+    def get_current_profile(self, match):
+        # the same for every match of the page, serialized once per request in
+        # the context shared by the serializers of the page
+        if "current_profile_data" not in self.context:
+            request = self.context.get("request")
+            serializer = SwipeProfileSerializer(request.user, many=False)
+            self.context["current_profile_data"] = serializer.data
+        return self.context["current_profile_data"]
 
     def get_matched_data(self, match):
         request = self.context.get("request")
@@ -196,19 +252,23 @@ class MatchSerializer(serializers.ModelSerializer):
         else:
             matched_profile = match.profile1
 
+        serializer = SwipeProfileSerializer(matched_profile, many=False)
+
         #  check if the matched profile is in a group
-        if matched_profile.member_group.all().exists():
-            matched_group = matched_profile.member_group.all()[0]
-            members = matched_group.members.count()
-            profile_serializer = SwipeProfileSerializer(matched_profile, many=False)
+        matched_group = next(iter(matched_profile.member_group.all()), None)
+        if matched_group:
+            # annotated by setup_eager_loading
+            if hasattr(matched_group, "members_count"):
+                members = matched_group.members_count
+            else:
+                members = matched_group.members.count()
 
             return {
-                "matched_profile": profile_serializer.data,
+                "matched_profile": serializer.data,
                 "is_group_match": True,
                 "members_count": members,
             }
 
-        serializer = SwipeProfileSerializer(matched_profile, many=False)
         return {
             "matched_profile": serializer.data,
             "is_group_match": False,
@@ -231,21 +291,29 @@ class ReceiverSerializer(serializers.ModelSerializer):
         return profile.member_group.all().exists()
 
     def get_photo(self, profile):
-        profile_photos = models.Photo.objects.filter(profile=profile).order_by(
-            "-created_at"
-        )
-        if profile_photos.exists():
-            first_photo = profile_photos.first()
+        # prefetched by ConversationSerializer.setup_eager_loading
+        if hasattr(profile, "recent_photos"):
+            first_photo = next(iter(profile.recent_photos), None)
+        else:
+            first_photo = (
+                models.Photo.objects.filter(profile=profile)
+                .order_by("-created_at")
+                .first()
+            )
+
+        if first_photo:
             serializer = PhotoSerializer(first_photo, many=False)
             return serializer.data
         else:
             return None
 
     def get_member_count(self, profile):
-        if profile.member_group.all().exists():
-            group = profile.member_group.all()[0]
-            count_members = group.members.count()
-            return count_members
+        group = next(iter(profile.member_group.all()), None)
+        if group:
+            # annotated by ConversationSerializer.setup_eager_loading
+            if hasattr(group, "members_count"):
+                return group.members_count
+            return group.members.count()
         return None
 
 
@@ -272,11 +340,17 @@ class MessageSerializer(serializers.ModelSerializer):
 
     def get_sender_photo(self, message):
         sender = message.sender
-        sender_photos = models.Photo.objects.filter(profile=sender).order_by(
-            "-created_at"
-        )
-        if sender_photos.exists():
-            first_photo = sender_photos.first()
+        # prefetched by ConversationSerializer.setup_eager_loading
+        if hasattr(sender, "recent_photos"):
+            first_photo = next(iter(sender.recent_photos), None)
+        else:
+            first_photo = (
+                models.Photo.objects.filter(profile=sender)
+                .order_by("-created_at")
+                .first()
+            )
+
+        if first_photo:
             serializer = PhotoSerializer(first_photo, many=False)
             return serializer.data
         else:
@@ -299,20 +373,39 @@ class ConversationSerializer(serializers.ModelSerializer):
         model = models.Conversation
         fields = ["id", "type", "receiver", "last_message"]
 
+    # prefetch plan: the participants with their photo and group, and the last
+    # message with its sender, a constant number of queries per page
+    @staticmethod
+    def setup_eager_loading(queryset):
+        participants = models.Profile.objects.prefetch_related(
+            get_recent_photos(),
+            Prefetch("member_group", queryset=get_groups_with_count()),
+        )
+        return queryset.select_related("last_message").prefetch_related(
+            Prefetch("participants", queryset=participants),
+            Prefetch(
+                "last_message__sender",
+                queryset=models.Profile.objects.prefetch_related(get_recent_photos()),
+            ),
+        )
+
     def get_receiver(self, conversation):
         request = self.context.get("request")
         current_profile = request.user
-        receiver = g.get_receiver(current_profile, conversation)
+        receiver = next(
+            participant
+            for participant in conversation.participants.all()
+            if participant.id != current_profile.id
+        )
         serializer = ReceiverSerializer(receiver, many=False)
         return serializer.data
 
     def get_last_message(self, conversation):
+        # kept by Message.save
         request = self.context.get("request")
-        has_messages = c.check_conversation_with_messages(conversation)
-        if has_messages:
-            last_message = g.get_last_message(conversation)
+        if conversation.last_message_id:
             serializer = MessageSerializer(
-                last_message, many=False, context={"request": request}
+                conversation.last_message, many=False, context={"request": request}
             )
             return serializer.data
         return None
@@ -382,3 +475,20 @@ class UpdateLocation(serializers.Serializer):
 
 class GroupSerializerWithMember(serializers.Serializer):
     member_id = serializers.CharField(required=True, allow_null=False)
+
+
+class SwipeActionSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    action = serializers.ChoiceField(choices=["like", "pass"])
+
+
+class SwipeBatchSerializer(serializers.Serializer):
+    actions = SwipeActionSerializer(many=True, allow_empty=False)
+
+    def validate_actions(self, value):
+        if len(value) > settings.SWIPE_BATCH_MAX_ACTIONS:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than "
+                f"{settings.SWIPE_BATCH_MAX_ACTIONS} elements."
+            )
+        return value
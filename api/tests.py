@@ -1,3 +1,588 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.gis.geos import Point
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from api import models
+from api.handlers.jobs import job
+from api.management.commands.run_jobs import Command as RunJobsCommand
+import api.handlers.deck_cache as deck_cache
+import api.handlers.geo_index as geo_index
+import api.handlers.jobs as jobs
+import api.handlers.matchmaking as matchmaking
+import api.handlers.message_buffer as message_buffer
+from service.core.pagination import DeckPagination, MatchPagination
+
+# * -------------------------- JOBS -----------------------------
+
+calls = []
+
+
+@job
+def record_call(value):
+    calls.append(value)
+
+
+@job
+def fail():
+    raise RuntimeError("failed job")
+
+
+@override_settings(JOBS_BACKEND="database")
+class RunJobsTests(TransactionTestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_once_runs_the_jobs_with_many_threads(self):
+        for value in range(6):
+            jobs.enqueue(record_call, value=value)
+
+        call_command("run_jobs", concurrency=4, once=True, poll=0, stdout=StringIO())
+
+        self.assertEqual(sorted(calls), list(range(6)))
+        self.assertEqual(
+            models.Job.objects.filter(status=models.Job.STATUS.DONE).count(), 6
+        )
+
+    def test_once_without_jobs_exits(self):
+        call_command("run_jobs", concurrency=4, once=True, poll=0, stdout=StringIO())
+
+        self.assertEqual(calls, [])
+
+
+class CountFreeSlotsTests(SimpleTestCase):
+    def test_takes_every_free_slot(self):
+        slots = threading.Semaphore(4)
+
+        self.assertEqual(RunJobsCommand().count_free_slots(slots, 4), 4)
+
+    def test_takes_only_the_free_slots(self):
+        slots = threading.Semaphore(4)
+        slots.acquire()
+        slots.acquire()
+
+        self.assertEqual(RunJobsCommand().count_free_slots(slots, 4), 2)
+
+
+@override_settings(JOBS_BACKEND="memory", JOBS_RETRY_BACKOFF=30, JOBS_MAX_ATTEMPTS=3)
+class MemoryJobsTests(SimpleTestCase):
+    def test_failed_job_is_retried_after_the_backoff(self):
+        with mock.patch("api.handlers.jobs.threading.Timer") as timer:
+            jobs.run_in_memory(jobs.get_job_name(fail), {})
+
+        timer.assert_called_once_with(
+            30, jobs.retry_in_memory, args=(jobs.get_job_name(fail), {}, 2)
+        )
+        timer.return_value.start.assert_called_once()
+
+    def test_backoff_doubles_on_every_attempt(self):
+        with mock.patch("api.handlers.jobs.threading.Timer") as timer:
+            jobs.run_in_memory(jobs.get_job_name(fail), {}, attempt=2)
+
+        self.assertEqual(timer.call_args[0][0], 60)
+
+    def test_last_attempt_is_not_retried(self):
+        with mock.patch("api.handlers.jobs.threading.Timer") as timer:
+            jobs.run_in_memory(jobs.get_job_name(fail), {}, attempt=3)
+
+        timer.assert_not_called()
+
+
+# * -------------------------- QUERY COUNTS -----------------------------
+
+
+class QueryCountTestCase(APITestCase):
+    """
+    The lists load their cards with the prefetch plans of the serializers, so
+    the number of queries of a page does not depend on the number of cards.
+    The count is taken with one card of each kind and pinned for a full page.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.current_profile = self.create_profile()
+        self.client.force_authenticate(user=self.current_profile)
+
+    def create_profile(self, **kwargs):
+        self.profile_count = getattr(self, "profile_count", 0) + 1
+        today = date.today()
+        return models.Profile.objects.create(
+            email=f"profile{self.profile_count}@test.local",
+            has_account=True,
+            age=25,
+            birthdate=date(today.year - 25, 1, 1),
+            location=Point(2.17, 41.38, srid=4326),
+            gender="M",
+            show_me="X",
+            **kwargs,
+        )
+
+    def create_group(self, size=2):
+        members = [self.create_profile(is_in_group=True) for i in range(size)]
+        group = models.Group.objects.create(owner=members[0])
+        group.members.add(*members)
+        group.save()
+        return group
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertQueriesPinned(self, url, add_cards):
+        add_cards()
+        queries = self.count_queries(url)
+
+        for i in range(4):
+            add_cards()
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+class SwipeQueryCountTests(QueryCountTestCase):
+    def add_cards(self):
+        self.create_profile()
+        self.create_group()
+
+    def test_list(self):
+        response = self.assertQueriesPinned(reverse("swipe-list"), self.add_cards)
+
+        self.assertEqual(response.data["group_count"], 5)
+        self.assertEqual(response.data["profile_count"], 5)
+
+    def test_deck(self):
+        response = self.assertQueriesPinned(reverse("swipe-deck"), self.add_cards)
+
+        self.assertEqual(len(response.data["results"]), 10)
+
+
+class LikesQueryCountTests(QueryCountTestCase):
+    def add_cards(self):
+        models.Like.objects.add(self.create_profile(), target=self.current_profile)
+        group = self.create_group()
+        for member in group.members.all():
+            models.Like.objects.add(member, target=self.current_profile)
+
+    def test_list_likes(self):
+        response = self.assertQueriesPinned(reverse("swipe-list-likes"), self.add_cards)
+
+        self.assertEqual(len(response.data["results"]), 10)
+
+
+class MatchesQueryCountTests(QueryCountTestCase):
+    def add_cards(self):
+        models.Match.objects.create(
+            profile1=self.current_profile, profile2=self.create_profile()
+        )
+        group = self.create_group()
+        models.Match.objects.create(profile1=self.current_profile, profile2=group.owner)
+
+    def test_list(self):
+        response = self.assertQueriesPinned(reverse("match-list"), self.add_cards)
+
+        self.assertEqual(len(response.data["results"]), 10)
+
+
+# * -------------------------- PAGINATION -----------------------------
+
+
+class DeckPaginationTests(SimpleTestCase):
+    def get_request(self, cursor):
+        return Request(APIRequestFactory().get("/", {"cursor": cursor}))
+
+    def test_cursor_carries_the_radius(self):
+        paginator = DeckPagination()
+        paginator.radius = 32
+        cursor = paginator.encode_cursor({"distance": 1.5, "id": "a"})
+
+        request = self.get_request(cursor)
+        self.assertEqual(DeckPagination().get_radius(request), 32)
+        self.assertEqual(DeckPagination().decode_cursor(request), [1.5, "a"])
+
+    def test_first_page_has_no_radius(self):
+        request = Request(APIRequestFactory().get("/"))
+
+        self.assertIsNone(DeckPagination().get_radius(request))
+
+    def test_radius_outside_the_steps_is_rejected(self):
+        paginator = DeckPagination()
+        paginator.radius = 20000
+        cursor = paginator.encode_cursor({"distance": 1.5, "id": "a"})
+
+        with self.assertRaises(NotFound):
+            DeckPagination().get_radius(self.get_request(cursor))
+
+
+# * -------------------------- MATCHES -----------------------------
+
+
+class UnmatchTests(APITestCase):
+    def setUp(self):
+        self.profile1, self.profile2, self.profile3 = [
+            models.Profile.objects.create(email=f"profile{i}@test.local")
+            for i in range(3)
+        ]
+        self.match = models.Match.objects.create(
+            profile1=self.profile1, profile2=self.profile2
+        )
+        # another match each, so a counter lowered twice does not stop at zero
+        models.Match.objects.create(profile1=self.profile1, profile2=self.profile3)
+        models.Match.objects.create(profile1=self.profile2, profile2=self.profile3)
+        self.client.force_authenticate(user=self.profile1)
+
+    def test_unmatch_with_a_conversation_counts_the_match_once(self):
+        conversation = models.Conversation.objects.create()
+        conversation.participants.set([self.profile1, self.profile2])
+
+        response = self.client.delete(reverse("match-detail", args=[self.match.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(models.Match.objects.filter(id=self.match.id).exists())
+        self.profile1.refresh_from_db()
+        self.profile2.refresh_from_db()
+        self.assertEqual(self.profile1.matches_count, 1)
+        self.assertEqual(self.profile2.matches_count, 1)
+
+
+class MutualLikeTests(TransactionTestCase):
+    """
+    Simultaneous mutual likes from threads, in the four like modes. The likes
+    that can end in the same match lock the same profiles, so every pair ends
+    with exactly one match
+    """
+
+    pairs = 5
+
+    def setUp(self):
+        self.profile_count = 0
+
+    def create_profile(self, is_in_group=False):
+        self.profile_count += 1
+        return models.Profile.objects.create(
+            email=f"profile{self.profile_count}@test.local",
+            has_account=True,
+            age=25,
+            is_in_group=is_in_group,
+        )
+
+    def create_group(self):
+        members = [self.create_profile(is_in_group=True) for i in range(2)]
+        group = models.Group.objects.create(owner=members[0])
+        group.members.add(*members)
+        group.save()
+        return members
+
+    def like_simultaneously(self, likes):
+        barrier = threading.Barrier(len(likes))
+        errors = []
+
+        def like(current_profile, liked_profile):
+            request = APIRequestFactory().post("/")
+            request.user = current_profile
+            try:
+                barrier.wait()
+                matchmaking.like(request, current_profile, liked_profile)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=like, args=args) for args in likes]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def assertOneMatch(self, profiles1, profiles2):
+        matches = models.Match.objects.filter(
+            Q(profile1__in=profiles1, profile2__in=profiles2)
+            | Q(profile1__in=profiles2, profile2__in=profiles1)
+        )
+        self.assertEqual(matches.count(), 1)
+
+    def test_one_to_one(self):
+        pairs = [
+            (self.create_profile(), self.create_profile()) for i in range(self.pairs)
+        ]
+
+        self.like_simultaneously(
+            [(a, b) for a, b in pairs] + [(b, a) for a, b in pairs]
+        )
+
+        for a, b in pairs:
+            self.assertOneMatch([a], [b])
+
+    def test_one_to_group(self):
+        pairs = [
+            (self.create_profile(), self.create_group()) for i in range(self.pairs)
+        ]
+
+        # the single profile likes the group while the owner likes it back
+        self.like_simultaneously(
+            [(profile, members[0]) for profile, members in pairs]
+            + [(members[0], profile) for profile, members in pairs]
+        )
+
+        for profile, members in pairs:
+            self.assertOneMatch([profile], members)
+
+    def test_group_to_one(self):
+        pairs = [
+            (self.create_group(), self.create_profile()) for i in range(self.pairs)
+        ]
+
+        # every member likes the single profile while it likes the group
+        self.like_simultaneously(
+            [(member, profile) for members, profile in pairs for member in members]
+            + [(profile, members[1]) for members, profile in pairs]
+        )
+
+        for members, profile in pairs:
+            self.assertOneMatch(members, [profile])
+
+    def test_group_to_group(self):
+        pairs = [(self.create_group(), self.create_group()) for i in range(self.pairs)]
+
+        self.like_simultaneously(
+            [(members1[0], members2[0]) for members1, members2 in pairs]
+            + [(members2[0], members1[0]) for members1, members2 in pairs]
+        )
+
+        for members1, members2 in pairs:
+            self.assertOneMatch(members1, members2)
+
+
+# * -------------------------- DECK CACHE -----------------------------
+
+
+class DeckCacheTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_removals_keep_every_removal(self):
+        profile_id = uuid.uuid4()
+        cards = [str(uuid.uuid4()) for i in range(20)]
+        deck_cache.set_deck(profile_id, [], cards, 8)
+        barrier = threading.Barrier(len(cards))
+
+        get_deck = deck_cache.get_deck
+
+        def slow_get_deck(profile_id):
+            # the other swipes run between the read and the write of the deck
+            deck = get_deck(profile_id)
+            time.sleep(0.01)
+            return deck
+
+        def remove(card_id):
+            barrier.wait()
+            deck_cache.remove_cards(profile_id, [card_id])
+
+        threads = [threading.Thread(target=remove, args=(card,)) for card in cards]
+        with mock.patch.object(deck_cache, "get_deck", slow_get_deck):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(deck_cache.get_deck(profile_id)["profiles"], [])
+
+    def test_lock_is_released(self):
+        with deck_cache.lock_deck("profile"):
+            pass
+
+        self.assertIsNone(cache.get(deck_cache.DECK_LOCK_KEY.format("profile")))
+
+
+# * -------------------------- GEO INDEX -----------------------------
+
+
+@override_settings(SWIPE_GEO_INDEX=True)
+class GeoIndexRebuildTests(SimpleTestCase):
+    def tearDown(self):
+        geo_index._index = None
+
+    def test_changes_during_the_rebuild_are_kept(self):
+        moved = uuid.uuid4()
+        removed = uuid.uuid4()
+        geo_index._index = geo_index.GeoGridIndex(0.1)
+        geo_index._index.upsert(removed, 2.17, 41.38, 25, "M", False)
+
+        def build_index():
+            # the database was read before the changes below
+            index = geo_index.GeoGridIndex(0.1)
+            index.upsert(removed, 2.17, 41.38, 25, "M", False)
+            geo_index.change_profile(moved, (2.17, 41.38, 25, "W", False))
+            geo_index.remove_profile(removed)
+            return index
+
+        geo_index._rebuilding = True
+        with mock.patch.object(geo_index, "build_index", build_index):
+            with mock.patch.object(geo_index.connection, "close"):
+                geo_index.rebuild_index()
+
+        self.assertEqual(geo_index.get_index().query(2.17, 41.38, 1), [moved])
+        self.assertFalse(geo_index._rebuilding)
+        self.assertEqual(geo_index._changes, {})
+
+
+# * -------------------------- CONVERSATIONS -----------------------------
+
+
+class LastMessageTests(TestCase):
+    def setUp(self):
+        self.profile = models.Profile.objects.create(email="sender@test.local")
+        self.conversation = models.Conversation.objects.create()
+        now = timezone.now()
+        self.first = models.Message.objects.create(
+            conversation=self.conversation,
+            sender=self.profile,
+            sent_at=now - timedelta(minutes=1),
+        )
+        self.last = models.Message.objects.create(
+            conversation=self.conversation, sender=self.profile, sent_at=now
+        )
+
+    def test_deleting_the_last_message_takes_the_previous_one(self):
+        self.last.delete()
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, self.first.id)
+        self.assertEqual(self.conversation.last_message_at, self.first.sent_at)
+
+    def test_deleting_every_message_clears_both_fields(self):
+        models.Message.objects.filter(conversation=self.conversation).delete()
+
+        self.conversation.refresh_from_db()
+        self.assertIsNone(self.conversation.last_message_id)
+        self.assertIsNone(self.conversation.last_message_at)
+
+    def test_deleting_the_conversation_does_not_move_the_last_message(self):
+        with CaptureQueriesContext(connection) as queries:
+            models.Conversation.objects.filter(id=self.conversation.id).delete()
+
+        self.assertFalse(
+            [
+                query
+                for query in queries.captured_queries
+                if 'SET "last_message_id" = (SELECT' in query["sql"]
+            ]
+        )
+        self.assertFalse(
+            models.Message.objects.filter(conversation=self.conversation).exists()
+        )
+
+    def test_deleting_an_older_message_keeps_the_last_one(self):
+        self.first.delete()
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_id, self.last.id)
+
+
+# * -------------------------- CHAT WRITE-BEHIND -----------------------------
+
+
+@override_settings(
+    CHAT_WRITE_BEHIND_BATCH_SIZE=2,
+    CHAT_WRITE_BEHIND_INTERVAL=0,
+    CHAT_WRITE_BEHIND_MAX_ATTEMPTS=3,
+)
+class MessageBufferTests(SimpleTestCase):
+    def setUp(self):
+        message_buffer.pending.clear()
+        message_buffer.in_flight.clear()
+
+    def tearDown(self):
+        message_buffer.pending.clear()
+        message_buffer.in_flight.clear()
+        message_buffer.flush_task = None
+
+    def run_buffer(self, messages):
+        async def run():
+            for message in messages:
+                message_buffer.add(message)
+            # until every message is saved or dropped
+            while (
+                message_buffer.pending
+                or message_buffer.in_flight
+                or message_buffer.flush_tasks
+            ):
+                await asyncio.sleep(0.01)
+
+        asyncio.run(run())
+
+    def test_batch_flush_task_is_referenced(self):
+        with mock.patch.object(message_buffer, "save_messages", return_value=[]):
+
+            async def run():
+                message_buffer.add(models.Message())
+                message_buffer.add(models.Message())
+                self.assertEqual(len(message_buffer.flush_tasks), 1)
+                await asyncio.gather(*message_buffer.flush_tasks)
+                self.assertEqual(message_buffer.flush_tasks, set())
+
+            asyncio.run(run())
+
+    def test_failed_messages_are_retried_then_dropped(self):
+        batches = []
+
+        def save_messages(messages):
+            batches.append(len(messages))
+            return messages[:1]
+
+        with mock.patch.object(message_buffer, "save_messages", save_messages):
+            self.run_buffer([models.Message(), models.Message()])
+
+        self.assertEqual(batches, [2, 1, 1])
+        self.assertEqual(message_buffer.pending, [])
+
+    def test_exit_saves_the_batches_in_flight(self):
+        saving = models.Message()
+        waiting = models.Message()
+        message_buffer.in_flight[1] = [saving]
+        message_buffer.pending.append(waiting)
+
+        with mock.patch.object(
+            message_buffer, "save_messages", return_value=[]
+        ) as save_messages:
+            message_buffer.flush_on_exit()
+
+        save_messages.assert_called_once_with([saving, waiting])
+        self.assertEqual(message_buffer.in_flight, {})
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    def test_cursor_with_invalid_values_is_not_found(self):
+        paginator = MatchPagination()
+        cursor = paginator.write_cursor(["not a date", "not a uuid"])
+        request = Request(APIRequestFactory().get("/", {"cursor": cursor}))
+
+        with self.assertRaises(NotFound):
+            paginator.paginate_queryset(models.Match.objects.all(), request)
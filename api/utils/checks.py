@@ -5,8 +5,6 @@
 from django.db.models import Q
 from api import models, serializers
 
-import api.utils.gets as g
-
 
 def check_conversation_between(p1, p2):
     conversation = models.Conversation.objects.filter(participants=p1).filter(
@@ -15,18 +13,6 @@ def check_conversation_between(p1, p2):
     return conversation.exists()
 
 
-def check_conversation_with_messages(conversation):
-    messages = models.Message.objects.filter(conversation=conversation)
-    return messages.count() >= 1
-
-
 def check_mygroup_messages(my_group):
     mygroup_messages = models.MyGroupMessage.objects.filter(group=my_group)
     return mygroup_messages.count() >= 1
-
-
-def check_profiles_with_messages(p1, p2):
-    conversation = g.get_conversation_between(p1, p2)
-    if conversation:
-        messages = check_conversation_with_messages(conversation)
-        return messages
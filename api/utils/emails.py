@@ -1,10 +1,25 @@
 from service.settings import EMAIL_HOST_USER
-from django.core.mail import EmailMessage
+from django.conf import settings
+from django.core.mail import EmailMessage, send_mail
+from django.utils import timezone
+from PIL import Image
 from api import models
+from api.handlers.jobs import job
+import io
 import os
 
 
-def send_report_email(reported_profile):
+# run as a background job: jobs.enqueue(send_report_email, report_id=...)
+@job
+def send_report_email(report_id):
+    report = models.Report.objects.select_related("reported").get(pk=report_id)
+
+    # a retried job does not send the report twice
+    if report.status != models.Report.STATUS.PENDING:
+        return
+
+    reported_profile = report.reported
+
     # get photos
     reported_profile_photos = models.Photo.objects.filter(
         profile=reported_profile.id
@@ -14,7 +29,7 @@ def send_report_email(reported_profile):
     subject, from_email, to = (
         "Toogether Profile Report",
         EMAIL_HOST_USER,
-        ["damianstonedev@gmail.com", "c3a.chris@gmail.com"],
+        settings.REPORT_EMAILS,
     )
 
     # email content
@@ -27,23 +42,51 @@ def send_report_email(reported_profile):
                 <li>Profile id: <strong>{reported_profile.id}<strong></li>
                 <li>Profile name: <strong>{reported_profile.name}</strong></li>
                 <li>Profile description: <strong>{reported_profile.description}</strong></li>
+                <li>Reason: <strong>{report.reason}</strong></li>
             </ul>
         """
 
     msg = EmailMessage(subject=subject, body=html_content, from_email=from_email, to=to)
     msg.content_subtype = "html"
 
-    # attach all profile photos to email
+    # attach a thumbnail of every profile photo to the email
     for photo in reported_profile_photos:
-        # get filename and ext
-        filename, ext = os.path.splitext(photo.image.name)
-
-        # get file type
-        file_type = ext.lower()[1:]
-
-        # attach image to email
-        with open(photo.image.path, "rb") as f:
-            msg.attach(filename, f.read(), f"image/{file_type}")
+        filename = os.path.splitext(os.path.basename(photo.image.name))[0]
+        msg.attach(f"{filename}.jpg", get_thumbnail(photo.image), "image/jpeg")
 
     # send email
     msg.send()
+
+    report.status = models.Report.STATUS.SENT
+    report.sent_at = timezone.now()
+    report.save(update_fields=["status", "sent_at"])
+
+
+"""
+    Downscale an image of the storage (local or S3) to a JPEG thumbnail, the
+    file is streamed from the storage instead of reading it from the disk
+    @param image: the ImageField file
+    @return: the bytes of the thumbnail
+"""
+
+
+def get_thumbnail(image):
+    with image.open("rb") as f:
+        picture = Image.open(f)
+        picture.thumbnail(settings.REPORT_THUMBNAIL_SIZE)
+        thumbnail = io.BytesIO()
+        picture.convert("RGB").save(thumbnail, format="JPEG", quality=85)
+    return thumbnail.getvalue()
+
+
+# run as a background job: jobs.enqueue(send_recovery_email, email=..., code=...)
+@job
+def send_recovery_email(email, code):
+    send_mail(
+        "Reset your password",
+        f"Here is your recovery password code {code}. "
+        "Please don't share it with anyone",
+        "toogethersite@gmail.com",
+        [email],
+        fail_silently=False,
+    )
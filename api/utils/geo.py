@@ -0,0 +1,30 @@
+"""
+    Geo helpers shared by the swipe views and handlers
+"""
+
+from django.contrib.gis.db import models
+from django.db.models import F, FloatField, Func, Value
+from django.db.models.functions import Cast
+
+
+class KNNDistance(Func):
+    """
+    PostGIS <-> operator on geography, used in ORDER BY it walks the spatial
+    index of the location from the nearest row instead of sorting the whole
+    table. The distance is in meters on the sphere, the <-> of the 4326
+    geometries would compare degrees and a degree of longitude gets shorter
+    away from the equator
+    """
+
+    arg_joiner = " <-> "
+    template = "(%(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, field, point, **extra):
+        point = Value(point, output_field=models.PointField(srid=point.srid))
+        super().__init__(to_geography(F(field)), to_geography(point), **extra)
+
+
+# the same cast in the queries and in the index of Profile.location
+def to_geography(expression):
+    return Cast(expression, output_field=models.PointField(geography=True))
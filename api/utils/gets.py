@@ -2,15 +2,18 @@
     Gets methods return querysets
 """
 
-from django.db.models import Q
 from api import models
 
-# * -------------------------- CONVERSATIONS -----------------------------
+# * -------------------------- GENERAL -----------------------------
+
 
+def get_in_order(queryset, ids):
+    # fetch the objects by id and return them following the order of the ids
+    objects = {str(obj.id): obj for obj in queryset.filter(id__in=ids)}
+    return [objects[str(id)] for id in ids if str(id) in objects]
 
-def get_receiver(current_profile, conversation):
-    receiver = conversation.participants.exclude(id=current_profile.id)
-    return receiver[0]
+
+# * -------------------------- CONVERSATIONS -----------------------------
 
 
 def get_conversation_between(p1, p2):
@@ -31,16 +34,6 @@ def get_group_between(p1, p2):
         return None
 
 
-def get_last_message(conversation):
-    messages = models.Message.objects.filter(conversation=conversation).order_by(
-        "-sent_at"
-    )
-    if messages.exists():
-        return messages.first()
-    else:
-        return None
-
-
 def get_mygroup_last_message(group):
     messages = models.MyGroupMessage.objects.filter(group=group).order_by("-sent_at")
     if messages.exists():
@@ -53,11 +46,4 @@ def get_mygroup_last_message(group):
 
 
 def get_match(p1, p2):
-    match = models.Match.objects.filter(
-        Q(profile1=p1, profile2=p2) | Q(profile1=p2, profile2=p1)
-    )
-
-    if match.exists():
-        return match.first()
-
-    return None
+    return models.Match.objects.between(p1, p2).first()
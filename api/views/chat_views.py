@@ -5,40 +5,32 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet, ModelViewSet, GenericViewSet
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Max
-from service.core.pagination import ChatPagination
+from service.core.pagination import ConversationPagination, MessagePagination
 from api import models, serializers
 
 import api.utils.gets as g
-import api.utils.checks as c
 
 
 class ConversationViewSet(GenericViewSet):
     permission_classes = [IsAuthenticated]
-    pagination_class = ChatPagination
+    pagination_class = MessagePagination
 
     def list(self, request):
         current_profile = request.user
 
-        conversations = current_profile.conversations.annotate(
-            latest_message=Max("message__sent_at")
-        ).order_by("-latest_message")
-
-        # list all the conversation with at least one message
-        conversations_w_messsages = []
-
-        for conv in conversations:
-            converation = c.check_conversation_with_messages(conv)
-            if converation:
-                conversations_w_messsages.append(conv)
+        # the conversations with at least one message, newest message first
+        conversations = serializers.ConversationSerializer.setup_eager_loading(
+            current_profile.conversations.filter(last_message_at__isnull=False)
+        )
 
-        messages = self.paginate_queryset(conversations_w_messsages)
+        paginator = ConversationPagination()
+        conversations = paginator.paginate_queryset(conversations, request, view=self)
 
         serializer = serializers.ConversationSerializer(
-            messages, many=True, context={"request": request}
+            conversations, many=True, context={"request": request}
         )
 
-        return self.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=["get"], url_path=r"messages")
     def list_messages(self, request, pk=None):
@@ -56,9 +48,7 @@ class ConversationViewSet(GenericViewSet):
                 {"detail": "Not authorized"}, status=status.HTTP_401_UNAUTHORIZED
             )
 
-        messages = models.Message.objects.filter(conversation=conversation).order_by(
-            "-sent_at"
-        )
+        messages = models.Message.objects.filter(conversation=conversation)
 
         messages = self.paginate_queryset(messages)
 
@@ -131,7 +121,7 @@ class ConversationViewSet(GenericViewSet):
 
 class MyGroupViewSet(GenericViewSet):
     permission_classes = [IsAuthenticated]
-    pagination_class = ChatPagination
+    pagination_class = MessagePagination
 
     def retrieve(self, request, pk=None):
         # retrieve my group in the format of conversation for the matches screen
@@ -171,9 +161,7 @@ class MyGroupViewSet(GenericViewSet):
                 {"detail": "Not authorized"}, status=status.HTTP_401_UNAUTHORIZED
             )
 
-        messages = models.MyGroupMessage.objects.filter(group=group).order_by(
-            "-sent_at"
-        )
+        messages = models.MyGroupMessage.objects.filter(group=group)
 
         messages = self.paginate_queryset(messages)
 
@@ -6,6 +6,7 @@ from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated
 from django.core.exceptions import ObjectDoesNotExist
 from api import models, serializers
+import api.handlers.deck_cache as deck_cache
 
 # Response constants
 NO_GROUP = "NO_GROUP"
@@ -40,7 +41,8 @@ class GroupViewSet(ModelViewSet):
         current_profile.is_in_group = True
 
         group.save()
-        current_profile.save()
+        current_profile.save(update_fields=["is_in_group"])
+        deck_cache.invalidate(current_profile.id)
         serializer = serializers.GroupSerializer(group, many=False)
         return Response(serializer.data)
 
@@ -68,8 +70,9 @@ class GroupViewSet(ModelViewSet):
         # change the property before delete the group
         for member in group.members.all():
             member.is_in_group = False
-            member.save()
+            member.save(update_fields=["is_in_group"])
 
+        deck_cache.invalidate(*group.members.values_list("id", flat=True))
         group.delete()
         return Response(
             {"detail": "Group deleted"},
@@ -112,8 +115,9 @@ class GroupViewSet(ModelViewSet):
         group.members.add(current_profile)
         current_profile.is_in_group = True
 
-        current_profile.save()
+        current_profile.save(update_fields=["is_in_group"])
         group.save()
+        deck_cache.invalidate(current_profile.id)
         serializer = serializers.GroupSerializer(group, many=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -130,6 +134,7 @@ class GroupViewSet(ModelViewSet):
             )
 
         if current_profile.id == group.owner.id:
+            deck_cache.invalidate(*group.members.values_list("id", flat=True))
             group.delete()
             return Response(
                 {"detail": "Group deleted"},
@@ -140,7 +145,8 @@ class GroupViewSet(ModelViewSet):
         current_profile.is_in_group = False
 
         group.save()
-        current_profile.save()
+        current_profile.save(update_fields=["is_in_group"])
+        deck_cache.invalidate(current_profile.id)
         return Response(
             {"detail": "You left the group"},
             status=status.HTTP_200_OK,
@@ -172,7 +178,8 @@ class GroupViewSet(ModelViewSet):
         group.members.remove(profile_to_remove)
         profile_to_remove.is_in_group = False
 
-        profile_to_remove.save()
+        profile_to_remove.save(update_fields=["is_in_group"])
         group.save()
+        deck_cache.invalidate(profile_to_remove.id)
         serializer = serializers.GroupSerializer(group, many=False)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -4,15 +4,17 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from api import models, serializers
 from django.contrib.auth.hashers import make_password
 from datetime import date
 from django.utils import timezone
 from django.contrib.gis.geos import GEOSGeometry
 from decimal import *
-from django.core.mail import send_mail
 
-from api.utils.emails import send_report_email
+from api.utils.emails import send_report_email, send_recovery_email
+import api.handlers.deck_cache as deck_cache
+import api.handlers.jobs as jobs
 
 import random
 import json
@@ -21,6 +23,7 @@ import json
 # simple json token
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.tokens import AccessToken
 
 # ----------------------- LOGIN --------------------------------
 
@@ -32,6 +35,10 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         for key, value in serializer.items():
             data[key] = value
 
+        # the tokens created by the login, with the names used by the clients
+        data["token"] = data["access"]
+        data["refresh_token"] = data["refresh"]
+
         return data
 
 
@@ -72,13 +79,7 @@ def recovery_code(request):
     )
     verification_code.save()
 
-    send_mail(
-        "Reset your password",
-        f"Here is your recovery password code {verification_code.code}. Please don't share it with anyone",
-        "toogethersite@gmail.com",
-        [email],
-        fail_silently=False,
-    )
+    jobs.enqueue(send_recovery_email, email=email, code=verification_code.code)
 
     return Response(
         {"detail": "We sent you an email with you recovery password code"},
@@ -112,11 +113,10 @@ def validate_code(request):
 
     # check that the code belongs to the user
     if verification_code == current_code and code_is_valid:
-        serializer = serializers.ProfileSerializer(current_profile, many=False)
         return Response(
             {
                 "detail": "Recovery code success",
-                "AccessToken": serializer.data["token"],
+                "AccessToken": str(AccessToken.for_user(current_profile)),
             },
             status=status.HTTP_200_OK,
         )
@@ -156,7 +156,7 @@ class ProfileViewSet(ModelViewSet):
             user = models.Profile.objects.create(
                 email=data["email"], password=make_password(data["password"])
             )
-            serializer = serializers.ProfileSerializer(user, many=False)
+            serializer = serializers.AuthProfileSerializer(user, many=False)
             return Response(serializer.data)
         except:
             message = {"detail": "User with this email already exist"}
@@ -217,7 +217,19 @@ class ProfileViewSet(ModelViewSet):
         if "description" in request.data:
             profile.description = fields_serializer.validated_data["description"]
 
-        profile.save()
+        # only the edited fields, the counters are written by api.handlers.counters
+        profile.save(
+            update_fields=[
+                "gender",
+                "show_me",
+                "nationality",
+                "city",
+                "instagram",
+                "university",
+                "description",
+            ]
+        )
+        deck_cache.invalidate(profile.id)
         profile_serializer = serializers.ProfileSerializer(profile, many=False)
         return Response(profile_serializer.data)
 
@@ -274,7 +286,19 @@ class ProfileViewSet(ModelViewSet):
             profile.age = age(profile.birthdate)
             profile.has_account = True
 
-        profile.save()
+        profile.save(
+            update_fields=[
+                "name",
+                "birthdate",
+                "university",
+                "description",
+                "gender",
+                "show_me",
+                "age",
+                "has_account",
+            ]
+        )
+        deck_cache.invalidate(profile.id)
         profile_serializer = serializers.ProfileSerializer(profile)
         return Response(profile_serializer.data)
 
@@ -293,7 +317,8 @@ class ProfileViewSet(ModelViewSet):
         point = {"type": "Point", "coordinates": [lat, lon]}
 
         profile.location = GEOSGeometry(json.dumps(point), srid=4326)
-        profile.save()
+        profile.save(update_fields=["location"])
+        deck_cache.invalidate(profile.id)
         serializer = serializers.ProfileSerializer(profile, many=False)
         return Response(serializer.data)
 
@@ -322,13 +347,16 @@ class ProfileViewSet(ModelViewSet):
         except ObjectDoesNotExist:
             return Response({"Error": "Profile does not exist"})
         profile.blocked_profiles.remove(blocked_profile)
+        deck_cache.invalidate(profile.id, blocked_profile.id)
         serializer = serializers.SwipeProfileSerializer(blocked_profile, many=False)
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"], url_path=r"actions/get-blocked-profiles")
     def get_blocked_profiles(self, request):
         current_profile = request.user
-        blocked_profiles = current_profile.blocked_profiles.all()
+        blocked_profiles = serializers.SwipeProfileSerializer.setup_eager_loading(
+            current_profile.blocked_profiles.all()
+        )
         serializer = serializers.SwipeProfileSerializer(blocked_profiles, many=True)
         return Response({"count": blocked_profiles.count(), "results": serializer.data})
 
@@ -341,7 +369,7 @@ class ProfileViewSet(ModelViewSet):
 
         if password == repeated_password:
             current_profile.password = make_password(password)
-            current_profile.save()
+            current_profile.save(update_fields=["password"])
             return Response(
                 {"detail": "You password has been reseted"}, status=status.HTTP_200_OK
             )
@@ -364,11 +392,18 @@ class ProfileViewSet(ModelViewSet):
                 {"Error": "Profile does not exist"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        # send report by email to admins
-        send_report_email(reported_profile=reported_profile)
+        with transaction.atomic():
+            # add the report to the moderation queue, the email to the admins
+            # is sent in the background
+            report = models.Report.objects.create(
+                reporter=current_profile,
+                reported=reported_profile,
+                reason=request.data.get("reason"),
+            )
+            jobs.enqueue(send_report_email, report_id=str(report.id))
 
-        # then block the reported profile
-        current_profile.block_profile(reported_profile)
+            # then block the reported profile
+            current_profile.block_profile(reported_profile)
 
         return Response(
             {"detail": "Report sent successfully"}, status=status.HTTP_200_OK
@@ -1,3 +1,5 @@
+import logging
+
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -5,16 +7,25 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.gis.measure import D
-from django.db.models import Q
-from itertools import chain
+from django.db import DatabaseError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.conf import settings
 
-from service.core.pagination import MatchPagination
+from service.core.pagination import DeckPagination, LikesPagination, MatchPagination
 from api import models, serializers
+from api.utils.geo import KNNDistance
 import api.handlers.matchmaking as matchmaking
 import api.handlers.swipe_filters as swipefilters
+import api.handlers.deck_cache as deck_cache
+import api.handlers.search_radius as search_radius
+import api.handlers.geo_index as geo_index
+import api.handlers.ranking as ranking
+import api.handlers.notifications as notifications
+import api.handlers.likes_inbox as likes_inbox
 
 import api.utils.gets as g
-import api.utils.checks as c
+
+logger = logging.getLogger(__name__)
 
 
 class SwipeModelViewSet(ModelViewSet):
@@ -23,9 +34,111 @@ class SwipeModelViewSet(ModelViewSet):
     # * List swipe profiles cards
     def list(self, request):
         current_profile = request.user
-        profiles = models.Profile.objects.all().filter(has_account=True)
-        groups = models.Group.objects.all()
 
+        error = self.check_swipe_profile(current_profile)
+        if error:
+            return error
+
+        adaptive = request.query_params.get("radius") == "auto"
+
+        # Read the deck from the cache and build it only when it is not cached
+        deck = deck_cache.get_deck(current_profile.id)
+        if deck is None or deck.get("adaptive") != adaptive:
+            deck = self.build_deck(current_profile, adaptive)
+
+        # Hydrate the cards in the order of the deck
+        show_groups = g.get_in_order(
+            serializers.SwipeGroupSerializer.setup_eager_loading(
+                models.Group.objects.all()
+            ),
+            deck["groups"],
+        )
+        show_profiles = g.get_in_order(
+            serializers.SwipeProfileSerializer.setup_eager_loading(
+                models.Profile.objects.all()
+            ),
+            deck["profiles"],
+        )
+
+        # Serialize data
+        profiles_serializer = serializers.SwipeProfileSerializer(
+            show_profiles, many=True
+        )
+        groups_serializer = serializers.SwipeGroupSerializer(show_groups, many=True)
+
+        # Concatenate groups and profiles data
+        data = groups_serializer.data + profiles_serializer.data  # type: ignore
+
+        # Custom response
+        return Response(
+            {
+                "distance": f"{deck['radius']}km",
+                "count": len(data),
+                "group_count": len(show_groups),
+                "profile_count": len(show_profiles),
+                "results": data,
+            }
+        )
+
+    # * Stream the swipe cards nearest first, 20 at a time
+    @action(detail=False, methods=["get"], url_path=r"actions/deck")
+    def deck(self, request):
+        current_profile = request.user
+
+        error = self.check_swipe_profile(current_profile)
+        if error:
+            return error
+
+        # the radius is searched on the first page and the cursor carries it to
+        # the next pages of the deck
+        paginator = DeckPagination()
+        radius = paginator.get_radius(request)
+        if radius is None:
+            radius = self.get_search_radius(
+                current_profile, request.query_params.get("radius") == "auto"
+            )
+        paginator.radius = radius
+
+        show_groups, show_profiles = self.get_swipe_cards(current_profile, radius)
+
+        # every card is anchored to one profile: the single profile itself or
+        # the owner of the group, so the cards can be ordered by distance
+        cards = (
+            models.Profile.objects.filter(
+                Q(id__in=show_profiles.values("id"))
+                | Q(Exists(show_groups.filter(owner=OuterRef("pk"))))
+            )
+            .filter(location__isnull=False)
+            .annotate(distance=KNNDistance("location", current_profile.location))
+        )
+        cards = serializers.SwipeProfileSerializer.setup_eager_loading(cards)
+
+        page = paginator.paginate_queryset(cards, request, view=self)
+
+        # the owners in a group are shown as their group card
+        owner_groups = {
+            group.owner_id: group
+            for group in serializers.SwipeGroupSerializer.setup_eager_loading(
+                models.Group.objects.filter(
+                    owner__in=[card.id for card in page if card.is_in_group]
+                )
+            )
+        }
+
+        data = []
+        for card in page:
+            if card.id in owner_groups:
+                serializer = serializers.SwipeGroupSerializer(owner_groups[card.id])
+            else:
+                serializer = serializers.SwipeProfileSerializer(card)
+            data.append(serializer.data)
+
+        response = paginator.get_paginated_response(data)
+        response.data["distance"] = f"{radius}km"
+        return response
+
+    # * Check the current profile can see swipe cards
+    def check_swipe_profile(self, current_profile):
         # Check if the profile has an age
         if not current_profile.age:
             return Response(
@@ -42,13 +155,46 @@ class SwipeModelViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        return None
+
+    # * Get the radius in km to search swipe cards, fixed or adaptive
+    def get_search_radius(self, current_profile, adaptive):
+        if not adaptive:
+            return settings.SWIPE_RADIUS_KM
+
+        def count_cards(radius, limit):
+            show_groups, show_profiles = self.get_swipe_cards(current_profile, radius)
+            return (
+                show_groups.values("id")[:limit].count()
+                + show_profiles.values("id")[:limit].count()
+            )
+
+        return search_radius.get_adaptive_radius(current_profile.location, count_cards)
+
+    # * Filter the groups and profiles the current profile can see in the swipe
+    def get_swipe_cards(self, current_profile, radius):
+        profiles = models.Profile.objects.all().filter(has_account=True)
+        groups = models.Group.objects.all()
+
         # Filter profiles and groups by distance
-        profiles_by_distance = profiles.filter(
-            location__distance_lt=(current_profile.location, D(km=8))
-        )
+        if geo_index.is_enabled():
+            profiles_by_distance, members_by_distance = self.get_indexed_profiles(
+                current_profile, profiles, radius
+            )
+        else:
+            profiles_by_distance = profiles.filter(
+                location__distance_lt=(current_profile.location, D(km=radius))
+            )
+            members_by_distance = profiles_by_distance
 
         # All the groups that have at least one member within the distance
-        groups_by_distance = groups.filter(members__in=profiles_by_distance).distinct()
+        groups_by_distance = groups.filter(
+            Exists(
+                models.Group.members.through.objects.filter(
+                    group=OuterRef("pk"), profile__in=members_by_distance
+                )
+            )
+        )
 
         # Apply swipe filters
         show_profiles = swipefilters.filter_profiles(
@@ -56,24 +202,46 @@ class SwipeModelViewSet(ModelViewSet):
         )
         show_groups = swipefilters.filter_groups(current_profile, groups_by_distance)
 
-        # Serialize data
-        profiles_serializer = serializers.SwipeProfileSerializer(
-            show_profiles, many=True
+        return show_groups, show_profiles
+
+    # * Profiles within the radius from the geo index: the single profiles that
+    # * match the swipe preferences and the group members
+    def get_indexed_profiles(self, current_profile, profiles, radius):
+        index = geo_index.get_index()
+        lon, lat = current_profile.location.x, current_profile.location.y
+        min_age, max_age = swipefilters.get_age_range(current_profile.age)
+        show_gender = current_profile.show_me
+
+        single_ids = index.query(
+            lon,
+            lat,
+            radius,
+            gender=None if show_gender == "X" else show_gender,
+            min_age=min_age,
+            max_age=max_age,
+            is_in_group=False,
         )
-        groups_serializer = serializers.SwipeGroupSerializer(show_groups, many=True)
+        member_ids = index.query(lon, lat, radius, is_in_group=True)
 
-        # Concatenate groups and profiles data
-        data = groups_serializer.data + profiles_serializer.data  # type: ignore
+        return (
+            profiles.filter(id__in=single_ids),
+            profiles.filter(id__in=member_ids),
+        )
 
-        # Custom response
-        return Response(
-            {
-                "distance": "8km",
-                "count": len(data),
-                "group_count": show_groups.count(),
-                "profile_count": show_profiles.count(),
-                "results": data,
-            }
+    # * Compute the swipe cards of a profile and store their ids in the cache
+    def build_deck(self, current_profile, adaptive=False):
+        radius = self.get_search_radius(current_profile, adaptive)
+        show_groups, show_profiles = self.get_swipe_cards(current_profile, radius)
+
+        if settings.SWIPE_RANKING:
+            group_ids = ranking.rank_groups(current_profile, show_groups, radius)
+            profile_ids = ranking.rank_profiles(current_profile, show_profiles, radius)
+        else:
+            group_ids = show_groups.values_list("id", flat=True)
+            profile_ids = show_profiles.values_list("id", flat=True)
+
+        return deck_cache.set_deck(
+            current_profile.id, group_ids, profile_ids, radius, adaptive
         )
 
     def retrieve(self, request, pk=None):
@@ -123,38 +291,105 @@ class SwipeModelViewSet(ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        current_is_in_group = current_profile.is_in_group
-        liked_is_in_group = liked_profile.is_in_group
+        # remove the liked card from the cached deck of the current profile
+        deck_cache.remove_cards(
+            current_profile.id,
+            [liked_profile.id]
+            + list(liked_profile.member_group.values_list("id", flat=True)),
+        )
 
-        # check for one to one
-        if not current_is_in_group and not liked_is_in_group:
-            return matchmaking.like_one_to_one(request, current_profile, liked_profile)
+        return matchmaking.like(request, current_profile, liked_profile)
 
-        # like one to group
-        if not current_is_in_group and liked_is_in_group:
-            liked_group = liked_profile.member_group.all()[0]
-            return matchmaking.like_one_to_group(request, current_profile, liked_group)
+    @action(detail=True, methods=["post"], url_path=r"actions/pass")
+    def pass_profile(self, request, pk=None):
+        current_profile = request.user
 
-        # like group to one
-        if current_is_in_group and not liked_is_in_group:
-            current_group = current_profile.member_group.all()[0]
-            return matchmaking.like_group_to_one(
-                request, current_profile, current_group, liked_profile
+        try:
+            passed_profile = models.Profile.objects.get(pk=pk)
+        except ObjectDoesNotExist:
+            return Response(
+                {"details": "Profile you tried to pass does not exist!"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # like group to group
-        if current_is_in_group and liked_is_in_group:
-            current_group = current_profile.member_group.all()[0]
-            liked_group = liked_profile.member_group.all()[0]
-            return matchmaking.like_group_to_group(
-                request, current_profile, current_group, liked_group
+        if current_profile == passed_profile:
+            return Response(
+                {"details": "You cannot pass your own profile"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        return Response(
-            {"details": "Something went wrong when giving like"},
-            status=status.HTTP_400_BAD_REQUEST,
+        # remove the passed card from the cached deck of the current profile
+        deck_cache.remove_cards(
+            current_profile.id,
+            [passed_profile.id]
+            + list(passed_profile.member_group.values_list("id", flat=True)),
+        )
+
+        return matchmaking.pass_profile(current_profile, passed_profile)
+
+    # * Likes and passes sent together by the client, in the order of the swipes
+    @action(detail=False, methods=["post"], url_path=r"actions/batch")
+    def batch(self, request):
+        current_profile = request.user
+
+        fields_serializer = serializers.SwipeBatchSerializer(data=request.data)
+        fields_serializer.is_valid(raise_exception=True)
+        actions = fields_serializer.validated_data["actions"]
+
+        # read all the swiped profiles at once
+        profiles = models.Profile.objects.prefetch_related("member_group").in_bulk(
+            [swipe["id"] for swipe in actions]
         )
 
+        # the likes lock the liked profiles or the members of the liked groups
+        members = models.Group.members.through.objects.filter(
+            group__members__in=list(profiles)
+        ).values_list("profile_id", flat=True)
+
+        results = []
+        swiped_ids = []
+        with transaction.atomic():
+            # lock every profile the batch can touch at once in the order of the
+            # ids, two batches locking them swipe by swipe could deadlock
+            matchmaking.lock_profiles(current_profile.id, *profiles, *members)
+
+            for swipe in actions:
+                result = {"id": swipe["id"], "action": swipe["action"]}
+                results.append(result)
+
+                profile = profiles.get(swipe["id"])
+                if profile is None:
+                    result["details"] = "Profile does not exist"
+                    continue
+                if profile == current_profile:
+                    result["details"] = "You cannot swipe your own profile"
+                    continue
+
+                # a swipe that fails is rolled back alone
+                try:
+                    with transaction.atomic():
+                        if swipe["action"] == "pass":
+                            response = matchmaking.pass_profile(
+                                current_profile, profile
+                            )
+                        else:
+                            response = matchmaking.like(
+                                request, current_profile, profile
+                            )
+                except DatabaseError:
+                    logger.exception("Swipe of %s failed", profile.id)
+                    result["details"] = "The swipe could not be saved"
+                    continue
+                result.update(response.data)
+
+                swiped_ids.append(profile.id)
+                swiped_ids += [group.id for group in profile.member_group.all()]
+
+        # remove the swiped cards from the cached deck of the current profile
+        deck_cache.remove_cards(current_profile.id, swiped_ids)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["post"], url_path=r"actions/unlike")
     def unlike(self, request, pk=None):
         # unlike profile or group that I liked previously
@@ -171,7 +406,12 @@ class SwipeModelViewSet(ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-        unliked_profile.likes.remove(current_profile)
+        if isinstance(unliked_profile, models.Group):
+            likes = models.Like.objects.filter(group=unliked_profile)
+        else:
+            likes = models.Like.objects.filter(target=unliked_profile)
+        likes.filter(profile=current_profile).delete()
+        deck_cache.invalidate(current_profile.id)
         return Response({"details": "Unliked"})
 
     @action(detail=True, methods=["post"], url_path=r"actions/remove-like")
@@ -196,10 +436,11 @@ class SwipeModelViewSet(ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            for member in group.members.all():
-                current_profile.likes.remove(member)
+            likers = group.members.all()
         else:
-            current_profile.likes.remove(profile_to_remove)
+            likers = [profile_to_remove]
+
+        models.Like.objects.filter(profile__in=likers, target=current_profile).delete()
 
         return Response({"details": "Like removed"})
 
@@ -207,60 +448,40 @@ class SwipeModelViewSet(ModelViewSet):
     def list_likes(self, request):
         current_profile = request.user
 
-        #  tuple of the profiles ids
-        current_matches_ids = models.Match.objects.filter(
-            Q(profile1=current_profile.id) | Q(profile2=current_profile.id)
-        ).values_list("profile1", "profile2")
-
-        # transform to a list of ids
-        current_matches_ids = list(chain.from_iterable(current_matches_ids))
-
-        # all the current profile likes excluding the ones in which has a match
-        likes = current_profile.likes.exclude(id__in=current_matches_ids).distinct()
-
-        # get all the likes in the current user group
-        if current_profile.is_in_group:
-            current_group = current_profile.member_group.all()[0]
-            current_group_likes = current_group.likes.exclude(
-                id__in=current_matches_ids
-            ).distinct()
-            likes = likes.union(current_group_likes)
-
-        # single profile likes
-        profile_likes = []
-
-        # profiles in group likes
-        group_likes = []
-
-        for like_profile in likes:
-            # check wheter the like profile in is group or not
-            if like_profile.member_group.all().exists():
-                group = like_profile.member_group.all()[0]
-                if (
-                    current_profile.is_in_group
-                    and current_profile.member_group.all()[0] == group
-                ):
-                    continue
-                has_match = matchmaking.check_profile_group_has_match(
-                    current_profile.id, group
-                )
-                if group not in group_likes and not has_match:
-                    group_likes.append(group)
-            else:
-                profile_likes.append(like_profile)
+        # one card per liker or group of likers, newest like first
+        paginator = LikesPagination()
+        page = paginator.paginate_queryset(
+            likes_inbox.get_likes_inbox(current_profile), request, view=self
+        )
 
-        # serialize groups and profiles
-        groups_serializer = serializers.SwipeGroupSerializer(group_likes, many=True)
-        profiles_serializer = serializers.SwipeProfileSerializer(
-            profile_likes, many=True
+        # load the cards of the page with their prefetch plan
+        groups = g.get_in_order(
+            serializers.SwipeGroupSerializer.setup_eager_loading(
+                models.Group.objects.all()
+            ),
+            [card["card"] for card in page if card["liker_group"]],
         )
+        profiles = g.get_in_order(
+            serializers.SwipeProfileSerializer.setup_eager_loading(
+                models.Profile.objects.all()
+            ),
+            [card["card"] for card in page if not card["liker_group"]],
+        )
+
+        # serialize groups and profiles in the order of the page
+        cards = {}
+        for group, data in zip(
+            groups, serializers.SwipeGroupSerializer(groups, many=True).data
+        ):
+            cards[group.id] = data
+        for profile, data in zip(
+            profiles, serializers.SwipeProfileSerializer(profiles, many=True).data
+        ):
+            cards[profile.id] = data
 
-        # combine serializers to return group and profile models
-        data = groups_serializer.data + profiles_serializer.data
+        data = [cards[card["card"]] for card in page if card["card"] in cards]
 
-        return Response(
-            {"count": len(data), "results": data}, status=status.HTTP_200_OK
-        )
+        return paginator.get_paginated_response(data)
 
 
 class MatchModelViewSet(ModelViewSet):
@@ -278,18 +499,18 @@ class MatchModelViewSet(ModelViewSet):
     def list(self, request):
         current_profile = request.user
 
-        matches = models.Match.objects.filter(
-            Q(profile1=current_profile.id) | Q(profile2=current_profile.id)
+        # conversations between the profiles of the match that have messages
+        conversations = (
+            models.Conversation.objects.filter(participants=OuterRef("profile1"))
+            .filter(participants=OuterRef("profile2"))
+            .filter(Exists(models.Message.objects.filter(conversation=OuterRef("pk"))))
         )
 
-        matches_without_conversation = []
-        for match in matches:
-            # check if there is a conversation between the profiles and if there are messsages
-            conversation = c.check_profiles_with_messages(
-                match.profile1, match.profile2
-            )
-            if not conversation:
-                matches_without_conversation.append(match)
+        matches_without_conversation = serializers.MatchSerializer.setup_eager_loading(
+            models.Match.objects.filter(
+                Q(profile1=current_profile.id) | Q(profile2=current_profile.id)
+            ).filter(~Exists(conversations))
+        )
 
         matches_without_conversation = self.paginate_queryset(
             matches_without_conversation
@@ -348,16 +569,26 @@ class MatchModelViewSet(ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            for member in group.members.all():
-                current_profile.likes.remove(member)
+            likers = group.members.all()
         else:
-            current_profile.likes.remove(matched_profile)
+            likers = [matched_profile]
+
+        models.Like.objects.filter(profile__in=likers, target=current_profile).delete()
 
-        # delete conversation
+        # delete conversation, Conversation.delete also deletes the match
         conversation = g.get_conversation_between(current_profile, matched_profile)
         if conversation:
             conversation.delete()
 
-        matched_profile.likes.remove(current_profile)
-        match.delete()
+        models.Like.objects.filter(
+            profile=current_profile, target=matched_profile
+        ).delete()
+        notifications.publish(
+            [matched_profile.id], notifications.UNMATCH, {"match_id": str(match.id)}
+        )
+        # a second delete would send post_delete again and lower the counters
+        # twice
+        if not conversation:
+            match.delete()
+        deck_cache.invalidate(current_profile.id, matched_profile.id)
         return Response({"details": "Match deleted"}, status=status.HTTP_200_OK)
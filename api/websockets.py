@@ -1,6 +1,9 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from django.conf import settings
 from api import models
+import api.handlers.message_buffer as message_buffer
+import api.handlers.notifications as notifications
 import json
 
 
@@ -40,7 +43,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         message = text_data
 
-        if self.my_group_chat:
+        if settings.CHAT_WRITE_BEHIND:
+            # the message has its id already, it is saved after the broadcast
+            model = self.build_message(message)
+        elif self.my_group_chat:
             model = await sync_to_async(models.MyGroupMessage.objects.create)(
                 group=self.model,
                 sender=self.sender,
@@ -68,16 +74,61 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 "id": str(model.id),
                 "message": model.message,
                 "sent_at": model.get_sent_time(),
-                "sender_id": str(model.sender.id),
-                "sender_name": str(model.sender.name),
+                "sender_id": str(self.sender.id),
+                "sender_name": str(self.sender.name),
                 "sender_photo": self.sender_photo,
             },
         )
 
+        if settings.CHAT_WRITE_BEHIND:
+            message_buffer.add(model)
+
+    def build_message(self, message):
+        if self.my_group_chat:
+            return models.MyGroupMessage(
+                group=self.model, sender=self.sender, message=message
+            )
+        return models.Message(
+            conversation=self.model, sender=self.sender, message=message
+        )
+
     async def disconnect(self, close_code):
         # Remove the consumer from the chat room group
         await self.channel_layer.group_discard(self.chat_room, self.channel_name)
 
+        # save the buffered messages when a connection closes, the server closes
+        # them all when it shuts down
+        if settings.CHAT_WRITE_BEHIND:
+            await message_buffer.flush()
+
     async def chat_message(self, event):
         # send a message to the WebSocket connection that triggered the receive() method
         await self.send(text_data=json.dumps(event))
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        # get scope from middleware, the profile of the access token
+        self.profile = self.scope["sender"]
+
+        if not self.profile.is_authenticated:
+            await self.close()
+            return
+
+        # every profile has its own notifications group
+        self.notifications_group = notifications.get_group_name(self.profile.id)
+        await self.channel_layer.group_add(self.notifications_group, self.channel_name)
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "notifications_group"):
+            await self.channel_layer.group_discard(
+                self.notifications_group, self.channel_name
+            )
+
+    async def notify(self, event):
+        # send the event published by the matchmaking to the client
+        await self.send(
+            text_data=json.dumps({"event": event["event"], "data": event["data"]})
+        )
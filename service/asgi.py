@@ -17,7 +17,7 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 from django.urls import path
 
-from api.websockets import ChatConsumer
+from api.websockets import ChatConsumer, NotificationConsumer
 from service.core.SocketMiddleware import SocketAuthMiddleware
 
 
@@ -27,7 +27,12 @@ application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
         "websocket": SocketAuthMiddleware(
-            URLRouter([path("chat/<room_id>/", ChatConsumer.as_asgi())])
+            URLRouter(
+                [
+                    path("chat/<room_id>/", ChatConsumer.as_asgi()),
+                    path("notifications/", NotificationConsumer.as_asgi()),
+                ]
+            )
         ),
     }
 )
@@ -1,6 +1,9 @@
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
 from api.models import Profile, Conversation, Group, Photo
 from api import serializers
 from pathlib import Path
@@ -17,6 +20,18 @@ def get_sender(sender_id):
         return AnonymousUser()
 
 
+@database_sync_to_async
+def get_profile_from_token(token):
+    # without a valid access token return an AnonymousUser
+    if not token:
+        return AnonymousUser()
+    try:
+        access_token = AccessToken(token)
+        return Profile.objects.get(pk=access_token[api_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError, ValidationError, Profile.DoesNotExist):
+        return AnonymousUser()
+
+
 @database_sync_to_async
 def get_sender_photo(sender_profile):
     if sender_profile:
@@ -91,6 +106,13 @@ class SocketAuthMiddleware:
 
             # get query params
             query_string = urllib.parse.parse_qs(scope["query_string"].decode("utf-8"))
+
+            # the notifications are authenticated with the access token
+            if scope["path"].strip("/") == "notifications":
+                token = query_string.get("token", [None])[0]
+                scope["sender"] = await get_profile_from_token(token)
+                return await self.app(scope, receive, send)
+
             sender_id = query_string.get("sender_id", [None])[0]
             my_group_chat = query_string.get("my_group_chat", [None])[0]
 
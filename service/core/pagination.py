@@ -1,5 +1,19 @@
-from rest_framework.pagination import PageNumberPagination, CursorPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import (
+    BasePagination,
+    PageNumberPagination,
+    CursorPagination,
+)
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+import json
 
 
 class CustomNumberPagination(PageNumberPagination):
@@ -18,38 +32,205 @@ class CustomNumberPagination(PageNumberPagination):
         )
 
 
-class ChatPagination(PageNumberPagination):
-    page_size = 50
+class CustomCursorPagination(CursorPagination):
+    page_size = 2
+    cursor_query_param = "c"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate a queryset by the values of its ordering fields instead of an offset,
+    the cursor is the position of the last item of the page encoded as base64.
+    Every page costs the same and no COUNT(*) is done
+    """
+
+    page_size = 20
     max_page_size = 50
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    # the last field must be unique to break ties, e.g. ("-created_at", "-id")
+    ordering = ("-created_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        try:
+            if position is not None:
+                queryset = queryset.filter(self.get_position_filter(position))
+            results = list(queryset.order_by(*self.ordering)[: self.page_size + 1])
+        except (DjangoValidationError, ValueError):
+            # the values of the cursor do not fit the fields, e.g. a bad uuid
+            raise NotFound("Invalid cursor")
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_position_filter(self, position):
+        # (a, b) > (x, y) is the same as a > x OR (a = x AND b > y)
+        position_filter = Q()
+        equal_filter = Q()
+
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            position_filter |= equal_filter & Q(**{f"{name}__{lookup}": value})
+            equal_filter &= Q(**{name: value})
+
+        return position_filter
+
+    def decode_cursor(self, request):
+        position = self.read_cursor(request)
+        if position is None:
+            return None
+        return self.check_position(position)
+
+    def read_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+
+        try:
+            return json.loads(urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("Invalid cursor")
+
+    def check_position(self, position):
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound("Invalid cursor")
+        return position
+
+    def encode_cursor(self, item):
+        return self.write_cursor(self.get_position(item))
+
+    def write_cursor(self, data):
+        data = json.dumps(data, default=str).encode("utf-8")
+        return urlsafe_b64encode(data).decode("ascii")
+
+    def get_position(self, item):
+        # the items are model instances or the dicts of a values() queryset
+        if isinstance(item, dict):
+            return [item[field.lstrip("-")] for field in self.ordering]
+        return [getattr(item, field.lstrip("-")) for field in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        cursor = self.encode_cursor(self.page[-1])
+        return replace_query_param(url, self.cursor_query_param, cursor)
 
     def get_paginated_response(self, data):
         return Response(
             {
                 "next": self.get_next_link(),
-                "previous": self.get_previous_link(),
-                "count": self.page.paginator.count,
                 "page_count": len(data),
                 "results": data,
             }
         )
 
 
-class MatchPagination(PageNumberPagination):
+class DeckPagination(KeysetPagination):
+    """
+    Keyset pages of the swipe deck, nearest card first. The cursor also holds
+    the search radius of the first page, so the next pages of the deck are
+    filtered with the same radius without searching it again
+    """
+
     page_size = 20
-    max_page_size = 20
+    max_page_size = 50
+    ordering = ("distance", "id")
+    # set by the view before the page is paginated
+    radius = None
 
-    def get_paginated_response(self, data):
-        return Response(
-            {
-                "next": self.get_next_link(),
-                "previous": self.get_previous_link(),
-                "count": self.page.paginator.count,
-                "page_count": len(data),
-                "results": data,
-            }
+    def get_radius(self, request):
+        cursor = self.read_cursor(request)
+        if cursor is None:
+            return None
+
+        # only the radiuses the swipe can search, not one chosen by the client
+        radius = cursor.get("radius") if isinstance(cursor, dict) else None
+        if (
+            radius not in settings.SWIPE_RADIUS_STEPS_KM
+            and radius != settings.SWIPE_RADIUS_KM
+        ):
+            raise NotFound("Invalid cursor")
+        return radius
+
+    def decode_cursor(self, request):
+        cursor = self.read_cursor(request)
+        if cursor is None:
+            return None
+        if not isinstance(cursor, dict):
+            raise NotFound("Invalid cursor")
+        return self.check_position(cursor.get("position"))
+
+    def encode_cursor(self, item):
+        return self.write_cursor(
+            {"position": self.get_position(item), "radius": self.radius}
         )
 
 
-class CustomCursorPagination(CursorPagination):
-    page_size = 2
-    cursor_query_param = "c"
+class MatchPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 20
+    ordering = ("-created_at", "-id")
+
+
+class LikesPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 50
+    ordering = ("-liked_at", "-card")
+
+
+class ConversationPagination(KeysetPagination):
+    page_size = 50
+    max_page_size = 50
+    ordering = ("-last_message_at", "-id")
+
+
+class MessagePagination(KeysetPagination):
+    """
+    Keyset pages of a chat history, newest message first. The since and before
+    parameters (ISO 8601 dates) only return the messages sent after or before a
+    date, so the clients fetch only the messages they lack
+    """
+
+    page_size = 50
+    max_page_size = 50
+    ordering = ("-sent_at", "-id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        since = self.get_date(request, "since")
+        if since is not None:
+            queryset = queryset.filter(sent_at__gt=since)
+
+        before = self.get_date(request, "before")
+        if before is not None:
+            queryset = queryset.filter(sent_at__lt=before)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_date(self, request, param):
+        value = request.query_params.get(param)
+        if not value:
+            return None
+
+        try:
+            date = parse_datetime(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise ValidationError({param: "Invalid date, use ISO 8601"})
+
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date, timezone.utc)
+        return date
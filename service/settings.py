@@ -109,6 +109,80 @@ else:
         },
     }
 
+# cache used by the swipe deck, redis in production and local memory by default
+if "PRODUCTION" in os.environ:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# seconds a precomputed swipe deck stays in the cache
+SWIPE_DECK_CACHE_TIMEOUT = 60 * 15
+
+# radius in km used to search swipe cards
+SWIPE_RADIUS_KM = 8
+
+# adaptive radius (?radius=auto): the steps go from the min to the max radius
+SWIPE_RADIUS_STEPS_KM = [2, 4, 8, 16, 32, 64]
+SWIPE_TARGET_DECK_SIZE = 100
+SWIPE_RADIUS_CELL_DEGREES = 0.1
+SWIPE_RADIUS_CACHE_TIMEOUT = 60 * 60 * 6
+
+# in-process grid index of the profile locations used instead of the PostGIS
+# distance query to find the swipe candidates
+SWIPE_GEO_INDEX = False
+SWIPE_GEO_INDEX_CELL_DEGREES = 0.1
+SWIPE_GEO_INDEX_REFRESH = 60 * 10
+
+# order the swipe cards by score instead of the database order
+SWIPE_RANKING = False
+SWIPE_RANKING_WEIGHTS = {
+    "distance": 1.0,
+    "age": 0.5,
+    "recency": 0.5,
+    "photos": 0.3,
+    "liked_me": 1.5,
+}
+
+# passed profiles come back to the swipe after this time, None to never show them
+SWIPE_PASS_TTL = timedelta(days=30)
+
+# max number of likes and passes sent in one swipe batch
+SWIPE_BATCH_MAX_ACTIONS = 100
+
+# matches without a conversation are deleted by expire_matches after this time
+MATCH_EXPIRATION = timedelta(days=14)
+MATCH_EXPIRATION_BATCH_SIZE = 500
+
+# background jobs: "database" jobs are run by the run_jobs worker, "memory" jobs
+# run in the same process once the transaction is committed (local and tests)
+if "PRODUCTION" in os.environ:
+    JOBS_BACKEND = "database"
+else:
+    JOBS_BACKEND = "memory"
+JOBS_MAX_ATTEMPTS = 5
+# seconds before the first retry, doubled on every attempt
+JOBS_RETRY_BACKOFF = 30
+# seconds after which a running job is considered lost and run again
+JOBS_TIMEOUT = 60 * 10
+
+# chat messages: with the write-behind the messages are broadcast first and saved
+# in batches (api.handlers.message_buffer) instead of one insert per message
+CHAT_WRITE_BEHIND = False
+CHAT_WRITE_BEHIND_BATCH_SIZE = 50
+# seconds a message waits in the buffer at most
+CHAT_WRITE_BEHIND_INTERVAL = 0.5
+# saves of a message that fails before it is dropped
+CHAT_WRITE_BEHIND_MAX_ATTEMPTS = 3
+
 # SIMPLE JWT TO CREATE JSON ACCESS TOKENS
 SIMPLE_JWT = {
     # change the expiration of the token
@@ -116,7 +190,9 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=90),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
-    "UPDATE_LAST_LOGIN": False,
+    # the login writes last_login (one UPDATE per login), only the recency of
+    # the swipe ranking reads it
+    "UPDATE_LAST_LOGIN": SWIPE_RANKING,
     "ALGORITHM": "HS256",
     "SIGNING_KEY": SECRET_KEY,
     "VERIFYING_KEY": None,
@@ -265,3 +341,7 @@ EMAIL_PORT = os.environ["EMAIL_PORT"]
 EMAIL_HOST_USER = os.environ["EMAIL_HOST_USER"]
 EMAIL_HOST_PASSWORD = os.environ["EMAIL_HOST_PASSWORD"]
 EMAIL_USE_TLS = os.environ["EMAIL_USE_TLS"]
+
+# moderators that receive the reports, the photos are attached as thumbnails
+REPORT_EMAILS = ["damianstonedev@gmail.com", "c3a.chris@gmail.com"]
+REPORT_THUMBNAIL_SIZE = (512, 512)